@@ -0,0 +1,155 @@
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+from copy import deepcopy
+
+import pandas as pd
+
+from pear_schedule.scheduler.groupScheduling import GroupActivityScheduler
+from pear_schedule.scheduler.groupSearch import branchAndBound, compileGroupSearchProblem, constrainedActivityOrder
+from pear_schedule.scheduler.groupSolvers import GROUP_SOLVERS
+
+logger = logging.getLogger(__name__)
+
+GROUP_TIMESLOT_MAPPING = [(0,1), (0,6), (1,1), (1,6), (2,1), (2,6), (3,1), (3,6), (4,1), (4,6)]
+
+
+def makeSyntheticCentre(patients=2000, activities=5, timeslots=10, seed=0, fixedRatio=0.2, routineRatio=0.005, likesPerPatient=2):
+    # activity membership follows patients liking a few activities each, and a few patients have a
+    # routine ("-") in one of the group timeslots
+    rng = random.Random(seed)
+    patientIDs = list(range(1, patients + 1))
+    titles = [f"Group Activity {a}" for a in range(activities)]
+
+    activityMap = {title: set() for title in titles}
+    for pid in patientIDs:
+        for title in rng.sample(titles, min(likesPerPatient, activities)):
+            activityMap[title].add(pid)
+
+    records = []
+    for a, title in enumerate(titles):
+        isFixed = rng.random() < fixedRatio
+        fixedTimeSlots = ",".join(f"{d}-{h}" for d, h in rng.sample(GROUP_TIMESLOT_MAPPING[:timeslots], 2))
+        records.append({
+            "ActivityID": a,
+            "ActivityTitle": title,
+            "IsFixed": isFixed,
+            "FixedTimeSlots": fixedTimeSlots if isFixed else None,
+            "MinPeopleReq": 1,
+        })
+
+    timeTable = {pid: ["" for _ in range(timeslots)] for pid in patientIDs}
+    for pid in patientIDs:
+        if rng.random() < routineRatio:
+            timeTable[pid][rng.randrange(timeslots)] = "-"
+
+    return activityMap, timeTable, pd.DataFrame(records)
+
+
+def benchmarkEngine(engine, activityMap, timeTable, timeslots, groupActivityDF, memory=True):
+    GroupActivityScheduler.config["GROUP_SCHEDULING_ENGINE"] = engine
+    emptySlots = len(timeTable) * timeslots
+
+    start = time.perf_counter()
+    _, minEmptySlots, _, _ = GroupActivityScheduler.groupScheduling(activityMap, timeTable, timeslots, emptySlots, groupActivityDF)
+    elapsed = time.perf_counter() - start
+
+    if not memory:
+        return {"engine": engine, "emptySlots": minEmptySlots, "seconds": elapsed}
+
+    tracemalloc.start()
+    GroupActivityScheduler.groupScheduling(activityMap, timeTable, timeslots, emptySlots, groupActivityDF)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"engine": engine, "emptySlots": minEmptySlots, "seconds": elapsed, "peakMiB": peak / 2**20}
+
+
+def benchmarkSnapshot(timeTable, activities, repeat=20):
+    # cost of recording one incumbent: full timetable copy vs assignment vector copy
+    start = time.perf_counter()
+    for _ in range(repeat):
+        deepcopy(timeTable)
+    timeTableCopy = (time.perf_counter() - start) / repeat
+
+    assignment = [-1] * activities
+    start = time.perf_counter()
+    for _ in range(repeat):
+        list(assignment)
+    assignmentCopy = (time.perf_counter() - start) / repeat
+
+    return {"timeTableCopyMs": timeTableCopy * 1000, "assignmentCopyMs": assignmentCopy * 1000}
+
+
+def benchmarkSearchOptions(activityMap, timeTable, timeslots, groupActivityDF, tableSize=100000):
+    # nodes explored by the branch and bound search with each ordering / symmetry breaking / transposition
+    # table option
+    possibleTimeSlots = GroupActivityScheduler.getPossibleTimeSlots(list(activityMap.keys()), timeslots, groupActivityDF)
+    problem = compileGroupSearchProblem(activityMap, timeTable, timeslots, possibleTimeSlots)
+    emptySlots = len(timeTable) * timeslots
+
+    results = []
+    for order in ["insertion", "constrained"]:
+        orderedProblem = constrainedActivityOrder(problem) if order == "constrained" else problem
+        for symmetryBreaking, size in [(False, 0), (True, 0), (True, tableSize)]:
+            result = branchAndBound(orderedProblem, emptySlots, symmetryBreaking=symmetryBreaking, tableSize=size)
+            results.append({
+                "order": order,
+                "symmetryBreaking": symmetryBreaking,
+                "tableSize": size,
+                "emptySlots": result.emptySlots,
+                "nodes": result.nodes,
+                "tableHitRate": result.tableHits / result.tableLookups if result.tableLookups else 0.0,
+                "seconds": result.elapsed,
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--activities", type=int, default=5)
+    parser.add_argument("--timeslots", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engines", nargs="+", default=["bruteForce", "branchAndBound"], help="bruteForce or any of GROUP_SOLVERS (e.g. cpSat, pulp, dsatur)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc run")
+    parser.add_argument("--search-options", action="store_true", help="compare search ordering options instead of engines")
+    parser.add_argument("--table-size", type=int, default=100000, help="transposition table size compared by --search-options")
+    args = parser.parse_args()
+
+    config = {
+        "GROUP_TIMESLOTS": args.timeslots,
+        "GROUP_TIMESLOT_MAPPING": GROUP_TIMESLOT_MAPPING,
+        "GROUP_SEARCH_WORKERS": args.workers,
+    }
+    for cls in [GroupActivityScheduler, *GROUP_SOLVERS.values()]:
+        cls.init_app(config)
+
+    activityMap, timeTable, groupActivityDF = makeSyntheticCentre(
+        args.patients, args.activities, args.timeslots, args.seed
+    )
+
+    print(f"synthetic centre: {args.patients} patients, {args.activities} activities, {args.timeslots} timeslots")
+    if args.search_options:
+        for result in benchmarkSearchOptions(activityMap, timeTable, args.timeslots, groupActivityDF, args.table_size):
+            print(result)
+        return
+
+    print(benchmarkSnapshot(timeTable, args.activities))
+    results = []
+    for engine in args.engines:
+        results.append(benchmarkEngine(engine, activityMap, timeTable, args.timeslots, groupActivityDF, not args.no_memory))
+        print(results[-1])
+
+    # empty slots left over compared with the best engine, eg. how far dsatur is from an exact engine
+    best = min(result["emptySlots"] for result in results)
+    for result in results:
+        print(f"{result['engine']}: {result['emptySlots'] - best} more empty slots than the best engine")
+
+
+if __name__ == "__main__":
+    main()
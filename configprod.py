@@ -49,4 +49,25 @@ GROUP_TIMESLOTS = 10
 GROUP_TIMESLOT_MAPPING = [(0,1), (0,6), (1,1), (1,6), (2,1), (2,6), (3,1), (3,6), (4,1), (4,6)] #(day, timeslot in day)
 TARGET_WEEKLY_GROUP_ACTIVITIES = 6
 DAY_OF_WEEK_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-DAY_TIMESLOTS = ["9am-10am", "10am-11am", "11am-12pm", "12pm-1pm", "1pm-2pm","2pm-3pm","3pm-4pm", "4pm-5pm"]
\ No newline at end of file
+DAY_TIMESLOTS = ["9am-10am", "10am-11am", "11am-12pm", "12pm-1pm", "1pm-2pm","2pm-3pm","3pm-4pm", "4pm-5pm"]
+GROUP_SCHEDULING_ENGINE = "branchAndBound" # "bruteForce" (reference exhaustive search), "branchAndBound", "cpSat" (needs ortools), "pulp" (needs pulp) or "dsatur" (greedy colouring heuristic)
+GROUP_SEARCH_TIME_BUDGET_S = 60 # wall clock budget shared by both group search rounds, None for no limit
+GROUP_SEARCH_WORKERS = 1 # > 1 searches the group branch and bound subtrees in a process pool, speedup unmeasured so 1 by default
+GROUP_SEARCH_SPLIT_DEPTH = 2 # number of activities enumerated up front to split the search into subtrees
+GROUP_SEARCH_SYMMETRY_BREAKING = True # skip timeslots interchangeable with one already tried, same result with fewer nodes
+GROUP_SEARCH_ACTIVITY_ORDER = "insertion" # "insertion" or "constrained" (most constrained / largest first, may change result)
+GROUP_SOLVER_THREADS = 1 # search threads used by the cpSat / pulp group solvers
+GROUP_SEARCH_TRANSPOSITION_TABLE_SIZE = 100000 # search states remembered by branch and bound (LRU), 0 to disable
+GROUP_SEARCH_DECOMPOSE = True # solve groups of activities sharing no patients separately, same result
+GROUP_SEARCH_SPACE_LIMIT_LOG10 = 20 # components with more than 10^this estimated search leaves use GROUP_HEURISTIC_ENGINE, None to always search
+GROUP_HEURISTIC_ENGINE = "dsatur"
+GROUP_LOCAL_SEARCH_ITERATIONS = 0 # simulated annealing moves over both rounds after the search (eg. 100000), 0 keeps the search result as is
+GROUP_LOCAL_SEARCH_TIME_BUDGET_S = 5 # wall clock cap on the local search, None for no limit (a cap makes the result depend on machine load)
+GROUP_LOCAL_SEARCH_SEED = 0
+GROUP_WARM_START = None # start the group search from last week's timeslots: None, "cache" (GROUP_WARM_START_CACHE_FILE) or "schedule" (schedule table), may change how ties are broken
+GROUP_WARM_START_CACHE_FILE = None # absolute path of the file GROUP_WARM_START = "cache" reads and writes
+GROUP_RESULT_CACHE_DIR = None # absolute path of an on disk cache of group scheduling results for identical inputs (only point it at a directory the app owns, entries are unpickled), None to disable
+GROUP_RESULT_CACHE_MAX_BYTES = 64 * 2**20 # least recently used results are removed past this size
+PREFERENCE_SHUFFLE_SEED = 0 # seed for the order preferred activity candidates are tried in, mixed with the schedule week so reruns of a week match but weeks differ, None for a different order every run
+INDIVIDUAL_SCHEDULING_WORKERS = 1 # > 1 fills patients of the individual scheduling phases in a process pool, same result, speedup unmeasured so 1 by default
+INDIVIDUAL_SCHEDULING_CHUNK_SIZE = 64 # patients sent to a worker at a time
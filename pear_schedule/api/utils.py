@@ -5,6 +5,8 @@ from colorama import Fore
 from fastapi.encoders import jsonable_encoder
 from dateutil.parser import parse
 import datetime
+from pear_schedule.db_utils.utils import parse_fixed_time_slots
+from pear_schedule.scheduler.medicationScheduling import expandMedications
 from pear_schedule.db_utils.views import WeeklyScheduleView, CentreActivityPreferenceView, CentreActivityRecommendationView, ActivitiesExcludedView, RoutineView, MedicationTesterView, ActivityAndCentreActivityView
 import pandas as pd
 import re
@@ -163,30 +165,19 @@ def prepareMedicationSchedule(medications, schedule_start_datetime, schedule_end
     if medication_start_datetime < schedule_start_datetime:
         medication_start_datetime = schedule_start_datetime
     
-    for date in date_range(medication_start_datetime, medication_end_datetime, DAYS):
+    dates = list(date_range(medication_start_datetime, medication_end_datetime, DAYS))
+    for date in dates:
         medication_schedule[date.weekday()] = []
         medication_incorrect_schedule[date.weekday()] = []
-        
-        for index, medication_row in medications.iterrows():
-            if medication_row['StartDateTime'] <= date <= medication_row['EndDateTime']:
-                slots = medication_row['AdministerTime'].split(",")
-                for slot in slots:
-                    if medication_row['Instruction'] is None or medication_row['Instruction'].strip() == "" or medication_row['Instruction'] in ["Nil", "nil" "-"]:
-                        medication_schedule[date.weekday()].append(f"Give Medication@{slot}: {medication_row['PrescriptionName']}({medication_row['Dosage']})")
-                    else:
-                        medication_schedule[date.weekday()].append(f"Give Medication@{slot}: {medication_row['PrescriptionName']}({medication_row['Dosage']})**{medication_row['Instruction']}")
-                        
-    # Sort the medication schedules for each day based on time
-    for day, meds in medication_schedule.items():
-        medication_schedule[day] = sorted(meds, key=sort_by_time) 
+    
+    # Doses come out of the same expansion the medication scheduler uses, already sorted by time
+    doses = expandMedications(medications, dates)
+    for day, annotations in doses.groupby("day", sort=False)["annotation"]:
+        medication_schedule[dates[day].weekday()] = annotations.tolist()
                         
     return medication_schedule, medication_incorrect_schedule
     
     
-def sort_by_time(med_schedule):
-    return int(med_schedule.split('@')[1].split(':')[0])
-    
-    
 def date_range(start_date, end_date, DAYS):
     current_date = start_date
     counter = 1
@@ -671,8 +662,7 @@ def allCompulsoryActivitiesAtCorrectSlotSystemTest(weeklyScheduleViewDF, compuls
         patientSchedule = [scheduleRecord["Monday"].split("--"),scheduleRecord["Tuesday"].split("--"),scheduleRecord["Wednesday"].split("--"),scheduleRecord["Thursday"].split("--"),scheduleRecord["Friday"].split("--"),scheduleRecord["Saturday"].split("--")]
 
         for _, compActivityRecord, in compulsoryActivitiesDF.iterrows():
-            fixedTimeSlots = compActivityRecord["FixedTimeSlots"].split(",")
-            fixedTimeSlots = [(int(value.split("-")[0]), int(value.split("-")[1])) for value in fixedTimeSlots]
+            fixedTimeSlots = parse_fixed_time_slots(compActivityRecord["FixedTimeSlots"])
             compActivityName = compActivityRecord["ActivityTitle"]
 
             allCompulsoryScheduled = True
@@ -733,14 +723,12 @@ def fixedActivitiesScheduledCorrectlySystemTest(activitiesDF, validRoutinesDF, w
     fixedActivitiesDF = activitiesDF.query("IsFixed == True")
     fixedActivityMap = {} #activityTitle: set(fixedTimeSlots)
     for _, activityRecord in fixedActivitiesDF.iterrows():
-        fixedTimeSlots = activityRecord["FixedTimeSlots"].split(",")
-        fixedTimeSlots = set([(int(value.split("-")[0]), int(value.split("-")[1])) for value in fixedTimeSlots])
+        fixedTimeSlots = set(parse_fixed_time_slots(activityRecord["FixedTimeSlots"]))
         fixedActivityMap[activityRecord["ActivityTitle"]] = fixedTimeSlots
 
     routineActivityMap = {} #routine activityTitle: set(fixedTimeSlots)
     for _, routineRecord in validRoutinesDF.iterrows():
-        fixedTimeSlots = routineRecord["FixedTimeSlots"].split(",")
-        fixedTimeSlots = set([(int(value.split("-")[0]), int(value.split("-")[1])) for value in fixedTimeSlots])
+        fixedTimeSlots = set(parse_fixed_time_slots(routineRecord["FixedTimeSlots"]))
         routineActivityMap[routineRecord["ActivityTitle"]] = fixedTimeSlots
     
 
@@ -867,8 +855,7 @@ def clashInFixedTimeSlotWarning(activitiesDF, validRoutinesDF, request):
     fixedActivitiesDF = activitiesDF.query("IsFixed == True")
 
     for _, activityRecord in fixedActivitiesDF.iterrows():
-        fixedTimeSlots = activityRecord["FixedTimeSlots"].split(",")
-        fixedTimeSlots = [(int(value.split("-")[0]), int(value.split("-")[1])) for value in fixedTimeSlots]
+        fixedTimeSlots = parse_fixed_time_slots(activityRecord["FixedTimeSlots"])
         activityTitle = activityRecord["ActivityTitle"] + "(normal)"
         for ts in fixedTimeSlots:
             if ts not in timeSlotMap:
@@ -877,8 +864,7 @@ def clashInFixedTimeSlotWarning(activitiesDF, validRoutinesDF, request):
                 timeSlotMap[ts].append(activityTitle)
 
     for _, routineRecord in validRoutinesDF.iterrows():
-        fixedTimeSlots = routineRecord["FixedTimeSlots"].split(",")
-        fixedTimeSlots = [(int(value.split("-")[0]), int(value.split("-")[1])) for value in fixedTimeSlots]
+        fixedTimeSlots = parse_fixed_time_slots(routineRecord["FixedTimeSlots"])
         activityTitle = routineRecord["ActivityTitle"] + "(routine)"
         for ts in fixedTimeSlots:
             if ts not in timeSlotMap:
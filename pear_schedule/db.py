@@ -34,4 +34,11 @@ class DB:
     @classmethod
     def get_engine(cls):
         return cls.engine
-    
+
+    @classmethod
+    def dispose_inherited(cls):
+        # for forked worker processes: forget the pooled connections copied from the parent without closing
+        # them, so the worker never touches a connection (or transaction) the parent still holds
+        engine = getattr(cls, "engine", None)
+        if engine is not None:
+            engine.dispose(close=False)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+from typing import Sequence, Tuple
 from sqlalchemy import Select
 from datetime import datetime, timedelta
 
@@ -14,4 +16,28 @@ def get_next_sunday():
         days_until_sunday = (6 - today.weekday()) % 7  # Calculate the number of days until Sunday
     next_sunday = today + timedelta(days=days_until_sunday)  # Add days to today's date to get the next Sunday
     next_sunday = next_sunday.replace(hour=23, minute=59, second = 59)
-    return next_sunday
\ No newline at end of file
+    return next_sunday
+
+
+@lru_cache(maxsize=4096)
+def parse_fixed_time_slots(fixedTimeSlots: str) -> Tuple[Tuple[int, int], ...]:
+    # "d-h,d-h" FixedTimeSlots column value -> ((d, h), ...) in the order given. Every scheduler and
+    # system test reads the same few strings of a snapshot, so each is only parsed once. The result is
+    # shared between callers, hence a tuple.
+    slots = []
+    for value in fixedTimeSlots.split(","):
+        day, hour = value.split("-")
+        slots.append((int(day), int(hour)))
+
+    return tuple(slots)
+
+
+@lru_cache(maxsize=None)
+def _time_slot_indices(timeSlotMapping: Tuple[Tuple[int, int], ...]):
+    return {slot: i for i, slot in enumerate(timeSlotMapping)}
+
+
+def fixed_time_slot_indices(fixedTimeSlots: str, timeSlotMapping: Sequence[Tuple[int, int]]) -> Tuple[int, ...]:
+    # FixedTimeSlots as indices into timeSlotMapping, eg. the group timeslots of GROUP_TIMESLOT_MAPPING
+    indices = _time_slot_indices(tuple(map(tuple, timeSlotMapping)))
+    return tuple(indices[slot] for slot in parse_fixed_time_slots(fixedTimeSlots))
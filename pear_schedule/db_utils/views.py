@@ -499,6 +499,32 @@ class WeeklyScheduleView(BaseView): # Get the weekly schedule for all patients
         ).where(schedule.c["EndDate"] >= curDateTime)
         
         return query
+
+
+class PreviousWeekScheduleView(BaseView): # Get last week's schedule for all patients
+    @classmethod
+    def build_query(cls) -> Select:
+        logger.info("Building the previous week schedule query")
+        schema = DB.schema
+
+        schedule = schema.tables[cls.db_tables.SCHEDULE_TABLE]
+
+        lastWeekDateTime = datetime.now() - timedelta(days=7)
+
+        query: Select = select(
+            schedule.c["PatientID"],
+            schedule.c["Monday"],
+            schedule.c["Tuesday"],
+            schedule.c["Wednesday"],
+            schedule.c["Thursday"],
+            schedule.c["Friday"],
+        ).where(schedule.c["StartDate"] <= lastWeekDateTime
+        ).where(schedule.c["EndDate"] >= lastWeekDateTime
+        ).where(schedule.c["IsDeleted"] == False)
+
+        return query
+
+
 class MedicationTesterView(BaseView): # Just medication table view
     @classmethod
     def build_query(cls) -> Select:
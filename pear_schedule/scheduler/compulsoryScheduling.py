@@ -1,4 +1,5 @@
 from typing import List, Mapping
+from pear_schedule.db_utils.utils import parse_fixed_time_slots
 from pear_schedule.db_utils.views import CompulsoryActivitiesOnlyView
 from pear_schedule.scheduler.baseScheduler import BaseScheduler
 
@@ -11,11 +12,7 @@ class CompulsoryActivityScheduler(BaseScheduler):
         for activityTitle in compulsoryActivitiesDF["ActivityTitle"]:
             fixedSlotString = compulsoryActivitiesDF.query(f"ActivityTitle == '{activityTitle}'").iloc[0]['FixedTimeSlots']
 
-            fixedSlotArr = fixedSlotString.split(",")
-            for slot in fixedSlotArr:
-                day = int(slot.split("-")[0])
-                hour = int(slot.split("-")[1])
-
+            for day, hour in parse_fixed_time_slots(fixedSlotString):
                 for pid in patientSchedules.keys():
                     patientSchedules[pid][day][hour] = activityTitle 
 
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def canonicalHash(*parts) -> str:
+    # sha256 of the parts as sorted-key json, so equal inputs give the same key across runs and processes.
+    # Sets must be given as sorted lists by the caller, anything else json can't encode falls back to str.
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def encodeResult(result) -> list:
+    # (timeTable, *flags) -> json friendly list, the timetable as [patientId, slots] pairs so integer patient
+    # ids survive the round trip (json object keys are always strings)
+    timeTable, *rest = result
+    return [[[int(pid), list(slots)] for pid, slots in timeTable.items()], *rest]
+
+
+def decodeResult(value) -> tuple:
+    pairs, *rest = value
+    return ({pid: slots for pid, slots in pairs}, *rest)
+
+
+class ResultCache:
+    # Content addressed store of json results in a directory, one file per key. A hit refreshes the
+    # file's mtime and the oldest files are removed once the directory grows past maxBytes, so it
+    # behaves as an LRU shared by every process pointing at the same directory. Values must be json
+    # serialisable and come back as json decodes them (lists for tuples, str keys for dicts).
+    SUFFIX = ".json"
+
+    def __init__(self, directory: str, maxBytes: int):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hitRate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            # a corrupt entry is dropped and treated as a miss
+            logger.warning(f"Discarding unreadable group result cache entry {path}: {e}")
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file first so a concurrent reader never sees half an entry
+            fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f, separators=(",", ":"))
+            os.replace(tmpPath, self.path(key))
+            self.evict()
+        except (OSError, TypeError, ValueError) as e:
+            logger.exception(e)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            self.remove(os.path.join(self.directory, name))
+            self.evictions += 1
+            total -= size
+
+    def remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
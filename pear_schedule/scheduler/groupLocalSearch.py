@@ -0,0 +1,145 @@
+import math
+import random
+import time
+from typing import List, Optional
+
+from pear_schedule.scheduler.groupSearch import GroupSearchProblem, GroupSearchResult
+
+DEADLINE_CHECK_INTERVAL = 256  # moves between wall clock checks
+
+
+class LocalSearchState:
+    # Assignment of a GroupSearchProblem kept together with the occupancy it implies, so a move is checked
+    # and scored from the activities sharing its timeslots instead of rebuilding the timetable.
+    def __init__(self, problem: GroupSearchProblem, assignment: List[int]):
+        self.problem = problem
+        self.assignment = list(assignment)
+        self.busy = list(problem.initialBusy)
+        self.slotActivities = [set() for _ in problem.initialBusy]  # activities placed in each timeslot
+        self.filled = 0
+
+        for activity, ts in enumerate(self.assignment):
+            if ts >= 0:
+                self.busy[ts] |= problem.activityMasks[activity]
+                self.slotActivities[ts].add(activity)
+                self.filled += problem.activitySizes[activity]
+
+    def clashes(self, activity: int, ts: int) -> Optional[List[int]]:
+        # activities that must leave ts for activity to move there, None if a "-" block or an existing
+        # entry of the timetable is in the way
+        mask = self.problem.activityMasks[activity]
+        if self.problem.initialBusy[ts] & mask:
+            return None
+        if not self.busy[ts] & mask:
+            return []
+        return [other for other in self.slotActivities[ts] if other != activity and self.problem.activityMasks[other] & mask]
+
+    def relocateDelta(self, activity: int, clashes: List[int]) -> int:
+        # change in filled slots when activity takes a timeslot and its clashes are unscheduled
+        gain = self.problem.activitySizes[activity] if self.assignment[activity] < 0 else 0
+        return gain - sum(self.problem.activitySizes[other] for other in clashes)
+
+    def canSwap(self, first: int, second: int) -> bool:
+        # activities in the same timeslot never share patients, so removing one from busy is an xor
+        masks = self.problem.activityMasks
+        firstSlot, secondSlot = self.assignment[first], self.assignment[second]
+        return (
+            secondSlot in self.problem.possibleTimeSlots[first]
+            and firstSlot in self.problem.possibleTimeSlots[second]
+            and not (self.busy[secondSlot] ^ masks[second]) & masks[first]
+            and not (self.busy[firstSlot] ^ masks[first]) & masks[second]
+        )
+
+    def unschedule(self, activity: int):
+        ts = self.assignment[activity]
+        self.busy[ts] ^= self.problem.activityMasks[activity]
+        self.slotActivities[ts].remove(activity)
+        self.assignment[activity] = -1
+        self.filled -= self.problem.activitySizes[activity]
+
+    def schedule(self, activity: int, ts: int):
+        self.busy[ts] |= self.problem.activityMasks[activity]
+        self.slotActivities[ts].add(activity)
+        self.assignment[activity] = ts
+        self.filled += self.problem.activitySizes[activity]
+
+
+def simulatedAnnealing(
+    problem: GroupSearchProblem,
+    assignment: List[int],
+    emptySlots: int,
+    iterations: int,
+    seed: int = 0,
+    deadline: Optional[float] = None,
+) -> GroupSearchResult:
+    # Improves a feasible assignment with relocate moves (to another timeslot, or into the timetable for an
+    # unscheduled activity, unscheduling the activities it clashes with) and swaps of two activities'
+    # timeslots. emptySlots is the count for the given assignment. Worse moves are accepted with a
+    # probability falling as the temperature cools over the iterations. The best assignment seen is
+    # returned, so the result is never worse than the input, and the same seed gives the same result
+    # unless the deadline cuts the run short.
+    start = time.monotonic()
+    rng = random.Random(seed)
+    state = LocalSearchState(problem, assignment)
+    initialFilled = state.filled
+    bestFilled, bestAssignment = state.filled, list(state.assignment)
+
+    movable = [i for i, mask in enumerate(problem.activityMasks) if mask and problem.possibleTimeSlots[i]]
+    if not movable or iterations <= 0:
+        return GroupSearchResult(assignment=bestAssignment, emptySlots=emptySlots, isOptimal=False, nodes=0, elapsed=0)
+
+    # start around the size of a typical activity so losing one is sometimes accepted early on
+    startTemperature = max(1.0, sum(problem.activitySizes[i] for i in movable) / len(movable))
+    endTemperature = 0.05
+    cooling = (endTemperature / startTemperature) ** (1 / iterations)
+    temperature = startTemperature
+
+    moves = 0
+    timedOut = False
+    for moves in range(1, iterations + 1):
+        temperature *= cooling
+        if deadline is not None and moves % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+            timedOut = True
+            break
+
+        activity = rng.choice(movable)
+        current = state.assignment[activity]
+        ts = rng.choice(problem.possibleTimeSlots[activity])
+        if ts == current:
+            continue
+
+        if current >= 0 and rng.random() < 0.5:
+            others = [other for other in state.slotActivities[ts] if problem.possibleTimeSlots[other]]
+            if others:
+                other = rng.choice(others)
+                if state.canSwap(activity, other):
+                    state.unschedule(activity)
+                    state.unschedule(other)
+                    state.schedule(activity, ts)
+                    state.schedule(other, current)
+                continue
+
+        clashes = state.clashes(activity, ts)
+        if clashes is None:
+            continue
+        delta = state.relocateDelta(activity, clashes)
+        if delta < 0 and rng.random() >= math.exp(delta / temperature):
+            continue
+
+        for other in clashes:
+            state.unschedule(other)
+        if current >= 0:
+            state.unschedule(activity)
+        state.schedule(activity, ts)
+
+        if state.filled > bestFilled:
+            bestFilled, bestAssignment = state.filled, list(state.assignment)
+
+    return GroupSearchResult(
+        assignment=bestAssignment,
+        emptySlots=emptySlots - (bestFilled - initialFilled),
+        isOptimal=False,
+        nodes=moves,
+        elapsed=time.monotonic() - start,
+        timedOut=timedOut,
+    )
@@ -1,18 +1,42 @@
+from collections import Counter, defaultdict
 from copy import deepcopy
+from dataclasses import dataclass
+from functools import partial
+import json
+import os
+import tempfile
+import time
 from typing import List, Mapping
-from pear_schedule.db_utils.views import PatientsOnlyView, GroupActivitiesOnlyView,GroupActivitiesPreferenceView,GroupActivitiesRecommendationView,GroupActivitiesExclusionView
+from pear_schedule.db_utils.utils import fixed_time_slot_indices
+from pear_schedule.db_utils.views import PatientsOnlyView, GroupActivitiesOnlyView,GroupActivitiesPreferenceView,GroupActivitiesRecommendationView,GroupActivitiesExclusionView,PreviousWeekScheduleView
 
 import logging
 
+import numpy as np
+import pandas as pd
+
 from pear_schedule.scheduler.baseScheduler import BaseScheduler
+from pear_schedule.scheduler.groupCache import ResultCache, canonicalHash, decodeResult, encodeResult
+from pear_schedule.scheduler.groupLocalSearch import simulatedAnnealing
+from pear_schedule.scheduler.groupSearch import SearchTimeout, buildTimeTable, compileGroupSearchProblem, estimateSearchSpace, repairAssignment
+from pear_schedule.scheduler.groupSolvers import getGroupSolver, solveByComponents, solveWithWarmStart
 
 logger = logging.getLogger(__name__)
 
+# part of every result cache key, bump when a change to the group search can give a different timetable
+# for the same inputs so results cached by the old code are no longer returned
+GROUP_ENGINE_VERSION = 2
+
 
 class GroupActivityScheduler(BaseScheduler):
+    resultCache = None  # ResultCache for GROUP_RESULT_CACHE_DIR, created on first use
+
     @classmethod
     def fillSchedule(cls, patientSchedules: Mapping[str, List[str]]):
-        
+        # both search rounds share one wall clock budget and return their best timetable when it runs out
+        timeBudget = cls.config.get("GROUP_SEARCH_TIME_BUDGET_S")
+        deadline = time.monotonic() + timeBudget if timeBudget is not None else None
+
         activityMap = {} # mapping of activity Title: set of patients that can do the activity
         patientActivityCountMap = {} # mapping of activityID: count of number of patients to the activity
         activityMinSizeMap = {} # mapping of activity Tile: min size required for activity
@@ -36,45 +60,23 @@ class GroupActivityScheduler(BaseScheduler):
         groupExcludedDF = GroupActivitiesExclusionView().get_data()
 
         for _, record in groupActivityDF.iterrows():
-            patients = totalPatientSet.copy()
-            
-            activityID = record["ActivityID"]
-            activityTitle = record["ActivityTitle"]
-            minSizeRequired = record["MinPeopleReq"]
-
-            activityMinSizeMap[activityTitle] = minSizeRequired
-
-            # Find excluded patients from activity
-            excludedDF = groupExcludedDF.query(f"CentreActivityID == {activityID}")
-            for id in excludedDF["PatientID"]:
-                activityExclusionMap[activityTitle].add(id)
-                if id in patients:
-                    patients.remove(id)
-
-            # Find not recommended patients
-            notRecommendedDF = groupRecommendationDF.query(f"CentreActivityID == {activityID} and DoctorRecommendation == False")
-            for id in notRecommendedDF["PatientID"]:
-                activityExclusionMap[activityTitle].add(id)
-                if id in patients:
-                    patients.remove(id)
-
-
-            # Find recommended patients of activity
-            recommendedDF = groupRecommendationDF.query(f"CentreActivityID == {activityID} and DoctorRecommendation == True")
-            for id in recommendedDF["PatientID"]:
-                if id in patients:
-                    activityMap[activityTitle].add(id)
-                    patients.remove(id)
-                    patientActivityCountMap[id] += 1
-            
-        
-            # Find preferred patients of activity
-            preferredDF = groupPreferenceDF.query(f"CentreActivityID == {activityID} and IsLike == 1")
-            for id in preferredDF["PatientID"]:
-                if id in patients:
-                    activityMap[activityTitle].add(id)
-                    patients.remove(id)
-                    patientActivityCountMap[id] += 1
+            activityMinSizeMap[record["ActivityTitle"]] = record["MinPeopleReq"]
+
+        # excluded / not recommended patients can never join the activity, the rest join when recommended or liked
+        patientIDs = list(totalPatientSet)
+        eligibility = getEligibilityMatrices(
+            patientIDs, groupActivityDF["ActivityID"], groupPreferenceDF, groupRecommendationDF, groupExcludedDF
+        )
+        ineligible = eligibility.excluded | eligibility.notRecommended
+        eligible = (eligibility.recommended | eligibility.liked) & ~ineligible
+
+        patientIDArr = np.array(patientIDs, dtype=object)
+        for j, activityTitle in enumerate(groupActivityDF["ActivityTitle"]):
+            activityExclusionMap[activityTitle].update(patientIDArr[ineligible[:, j]])
+            activityMap[activityTitle].update(patientIDArr[eligible[:, j]])
+
+        for pid, count in zip(patientIDs, eligible.sum(axis=1).tolist()):
+            patientActivityCountMap[pid] += count
 
         
         toRemoveList = []
@@ -131,14 +133,41 @@ class GroupActivityScheduler(BaseScheduler):
                 if curActivity != "": # there is routine activity
                     timetable[patientID][i] = "-"
 
+        # timeslots the activities had last week, both rounds start from them when they still fit
+        previousSlots = cls.loadPreviousGroupSlots(set(groupActivityDF["ActivityTitle"]))
+
+        # the rest of the group phase only depends on what is computed up to here, so an identical centre
+        # reuses the timetable of an earlier run
+        cache = cls.getResultCache()
+        if cache is not None:
+            phaseKey = cls.resultCacheKey(
+                "phase",
+                activityMap,
+                timetable,
+                groupActivityDF,
+                previousSlots,
+                secondRoundList,
+                {title: sorted(patients) for title, patients in activityExclusionMap.items()},
+                activityMinSizeMap,
+            )
+            cached = cache.get(phaseKey)
+            if cached is not None:
+                cached = decodeResult(cached)
+                logger.info(f"Group phase loaded from result cache (hit rate {cache.hitRate:.2f})")
+                if cls.config.get("GROUP_WARM_START") == "cache":
+                    cls.saveGroupSlots(cached[0])
+                return cached
+
         # First round scheduling using brute force
         logger.info("First Round Scheduling")
-        firstTimeTable, firstEmptySlots = cls.bruteForceGroupScheduling(
+        firstTimeTable, firstEmptySlots, firstIsOptimal, firstTimedOut = cls.groupScheduling(
             activityMap, 
             timetable, 
             cls.config["GROUP_TIMESLOTS"], 
             patientCount * cls.config["GROUP_TIMESLOTS"], 
-            groupActivityDF
+            groupActivityDF,
+            deadline,
+            previousSlots,
         )
     
 
@@ -169,50 +198,223 @@ class GroupActivityScheduler(BaseScheduler):
        
         logger.info("Second Round Scheduling")
         # Second Round Scheduling
-        secondTimeTable, secondEmptySlots = cls.bruteForceGroupScheduling(
-            secondActivityMap, firstTimeTable, cls.config["GROUP_TIMESLOTS"], firstEmptySlots, groupActivityDF
+        secondTimeTable, secondEmptySlots, secondIsOptimal, secondTimedOut = cls.groupScheduling(
+            secondActivityMap, firstTimeTable, cls.config["GROUP_TIMESLOTS"], firstEmptySlots, groupActivityDF, deadline, previousSlots
         )
 
-        # all activities currently scheduled have hit min size, can continue to add patients to these activities
-        allScheduledActivitiesSet = getAllScheduledActivities(secondTimeTable)
-        activityToTimeSlotMap = getActivityToTimeSlotMap(secondTimeTable)
-        patientActivityCountMap = getpatientActivityCountMap(secondTimeTable)
-        
-        for pid in patientDF["PatientID"]:
+        # annealing stopped by its wall clock budget depends on machine load, so its result is not reusable
+        annealed = cls.config.get("GROUP_LOCAL_SEARCH_ITERATIONS", 0) > 0
+        reproducible = not annealed or cls.config.get("GROUP_LOCAL_SEARCH_TIME_BUDGET_S") is None
+        if annealed:
+            logger.info("Local Search Refinement")
+            secondTimeTable, secondEmptySlots = cls.refineGroupSchedule(
+                {**activityMap, **secondActivityMap}, timetable, secondTimeTable, secondEmptySlots, groupActivityDF
+            )
 
-            # if hit target number of group activities, do not need to schedule already
-            if patientActivityCountMap[pid] >= cls.config["TARGET_WEEKLY_GROUP_ACTIVITIES"]:
-                continue
-            
-            curPatientActivitiesSet = set()
-            for activity in secondTimeTable[pid]:
-                curPatientActivitiesSet.add(activity)
+        # all activities currently scheduled have hit min size, can continue to add patients to these activities
+        cls.fillToTarget(secondTimeTable, patientDF["PatientID"], activityExclusionMap)
 
-            # find activities that can be scheduled for patient
-            canBeScheduledSet = allScheduledActivitiesSet.difference(curPatientActivitiesSet)
-            
-            toAdd = min(len(canBeScheduledSet), cls.config["TARGET_WEEKLY_GROUP_ACTIVITIES"] - patientActivityCountMap[pid])
-
-            # Add patients to activities
-            while toAdd != 0 and canBeScheduledSet:
-                activity = canBeScheduledSet.pop()
-                activitySlot = activityToTimeSlotMap[activity]
-                if secondTimeTable[pid][activitySlot] == "" and pid not in activityExclusionMap[activity]:
-                    secondTimeTable[pid][activitySlot] = activity
-                    toAdd -= 1
-            
+        if cls.config.get("GROUP_WARM_START") == "cache":
+            cls.saveGroupSlots(secondTimeTable)
 
         # for p, slots in secondTimeTable.items():
         #     logger.info(f"{p} Schedule: {slots}")
+
+        # a heuristic round (eg. over GROUP_SEARCH_SPACE_LIMIT_LOG10) is not proven optimal but is still
+        # reproducible, only rounds cut short by the deadline depend on when they ran
+        isOptimal = firstIsOptimal and secondIsOptimal
+        timedOut = firstTimedOut or secondTimedOut
+        if cache is not None and not timedOut and reproducible:
+            cache.put(phaseKey, encodeResult((secondTimeTable, isOptimal, timedOut)))
         
-        return secondTimeTable
+        return secondTimeTable, isOptimal, timedOut
 
     @classmethod
-    def bruteForceGroupScheduling(cls, activityMap, timeTable, timeslots, emptySlots, groupActivityDF):
+    def getResultCache(cls):
+        # None when GROUP_RESULT_CACHE_DIR is not set. Entries are unpickled, so a relative directory that
+        # depends on where the app happens to be started from is refused.
+        directory = cls.config.get("GROUP_RESULT_CACHE_DIR")
+        if not directory:
+            return None
+        if not os.path.isabs(directory):
+            logger.warning(f"GROUP_RESULT_CACHE_DIR must be an absolute path, not using the result cache at {directory}")
+            return None
+        if cls.resultCache is None or cls.resultCache.directory != directory:
+            cls.resultCache = ResultCache(directory, cls.config.get("GROUP_RESULT_CACHE_MAX_BYTES", 64 * 2**20))
+        return cls.resultCache
+
+    @classmethod
+    def resultCacheKey(cls, kind, activityMap, timeTable, groupActivityDF, *inputs):
+        # Hash of everything a group scheduling result depends on: activity membership (in order, which
+        # decides ties), every timetable cell (routine "-" blocks and earlier rounds), fixed timeslots and
+        # min sizes, the group config (GROUP_TIMESLOT_MAPPING, engine and search options) and the engine
+        # version. Patient ids are kept in timetable order since the result is built in that order.
+        columns = [c for c in ["ActivityTitle", "IsFixed", "FixedTimeSlots", "MinPeopleReq"] if c in groupActivityDF.columns]
+        activities = sorted(groupActivityDF[columns].astype(str).values.tolist())
+        config = {
+            key: value for key, value in cls.config.items()
+            if (key.startswith("GROUP_") or key == "TARGET_WEEKLY_GROUP_ACTIVITIES") and not key.startswith("GROUP_RESULT_CACHE")
+        }
+        return canonicalHash(
+            kind,
+            GROUP_ENGINE_VERSION,
+            config,
+            [[title, sorted(patients)] for title, patients in activityMap.items()],
+            [[pid, slots] for pid, slots in timeTable.items()],
+            activities,
+            *inputs,
+        )
+
+    @classmethod
+    def loadPreviousGroupSlots(cls, groupActivityTitles):
+        # mapping of activity title: group timeslot it had last week, read from GROUP_WARM_START_CACHE_FILE
+        # or from last week's rows of the schedule table depending on GROUP_WARM_START
+        source = cls.config.get("GROUP_WARM_START")
+        try:
+            if source == "cache":
+                cacheFile = cls.getWarmStartCacheFile()
+                if cacheFile is None or not os.path.exists(cacheFile):
+                    return {}
+                with open(cacheFile) as f:
+                    return json.load(f)["activitySlots"]
+
+            elif source == "schedule":
+                return getGroupSlotsFromSchedules(
+                    PreviousWeekScheduleView.get_data(),
+                    groupActivityTitles,
+                    cls.config["GROUP_TIMESLOT_MAPPING"],
+                    cls.config["DAY_OF_WEEK_ORDER"],
+                )
+        except Exception as e:
+            # warm start only speeds up the search, schedule from scratch instead
+            logger.exception(e)
+            logger.warning(f"could not load previous group timeslots from {source}, starting cold")
+
+        return {}
+
+    @classmethod
+    def getWarmStartCacheFile(cls):
+        # None when GROUP_WARM_START_CACHE_FILE is not set, or is relative and would depend on where the app
+        # happens to be started from
+        cacheFile = cls.config.get("GROUP_WARM_START_CACHE_FILE")
+        if not cacheFile:
+            return None
+        if not os.path.isabs(cacheFile):
+            logger.warning(f"GROUP_WARM_START_CACHE_FILE must be an absolute path, not using the warm start cache at {cacheFile}")
+            return None
+        return cacheFile
+
+    @classmethod
+    def saveGroupSlots(cls, timeTable):
+        cacheFile = cls.getWarmStartCacheFile()
+        if cacheFile is None:
+            return
+
+        activitySlots = {activity: ts for activity, ts in getActivityToTimeSlotMap(timeTable).items() if activity != ""}
+        try:
+            # write to a temporary file first so a concurrent worker never reads half a file
+            fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cacheFile)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"activitySlots": activitySlots}, f)
+            os.replace(tmpPath, cacheFile)
+        except OSError as e:
+            logger.exception(e)
+
+    @classmethod
+    def refineGroupSchedule(cls, activityMap, timeTable, scheduledTimeTable, emptySlots, groupActivityDF):
+        # The two rounds are searched one after the other, so moving activities of both together can still
+        # fill more slots. Runs simulated annealing over the combined assignment within its own budget.
+        timeslots = cls.config["GROUP_TIMESLOTS"]
+        possibleTimeSlots = cls.getPossibleTimeSlots(list(activityMap.keys()), timeslots, groupActivityDF)
+        problem = compileGroupSearchProblem(activityMap, timeTable, timeslots, possibleTimeSlots)
+
+        activityToTimeSlotMap = getActivityToTimeSlotMap(scheduledTimeTable)
+        assignment = [activityToTimeSlotMap.get(activity, -1) for activity in problem.activityList]
+
+        timeBudget = cls.config.get("GROUP_LOCAL_SEARCH_TIME_BUDGET_S")
+        result = simulatedAnnealing(
+            problem,
+            assignment,
+            emptySlots,
+            cls.config["GROUP_LOCAL_SEARCH_ITERATIONS"],
+            cls.config.get("GROUP_LOCAL_SEARCH_SEED", 0),
+            time.monotonic() + timeBudget if timeBudget is not None else None,
+        )
+        logger.info(
+            f"local search made {result.nodes} moves in {result.elapsed:.3f}s, "
+            f"{emptySlots} -> {result.emptySlots} empty slots"
+        )
+
+        return buildTimeTable(problem, timeTable, result.assignment), result.emptySlots
+
+    @classmethod
+    def fillToTarget(cls, timeTable, patientIDs, activityExclusionMap):
+        # Each patient joins open activities at their free timeslots, earliest first, until they reach
+        # TARGET_WEEKLY_GROUP_ACTIVITIES or no activity fits. Group activities have no capacity limit, so
+        # patients never compete for a place and the order they are filled in does not matter.
+        target = cls.config["TARGET_WEEKLY_GROUP_ACTIVITIES"]
+        patientActivityCountMap = getpatientActivityCountMap(timeTable)
+
+        slotActivities = defaultdict(list) # mapping of timeslot: activities held there
+        for activity, ts in getActivityToTimeSlotMap(timeTable).items():
+            if activity != "":
+                slotActivities[ts].append(activity)
+
+        for pid in patientIDs:
+            count = patientActivityCountMap[pid]
+            slots = timeTable[pid]
+            for ts, current in enumerate(slots):
+                if count >= target:
+                    break
+                if current != "":
+                    continue
+
+                for activity in slotActivities[ts]:
+                    if pid not in activityExclusionMap[activity]:
+                        slots[ts] = activity
+                        count += 1
+                        break
+
+        return timeTable
+
+    @classmethod
+    def groupScheduling(cls, activityMap, timeTable, timeslots, emptySlots, groupActivityDF, deadline=None, previousSlots=None):
+        engine = cls.config.get("GROUP_SCHEDULING_ENGINE", "branchAndBound")
+
+        # results cut short by the deadline are not cached, they depend on how far the search got in time.
+        # Heuristic results are, they are the same for the same input.
+        cache = cls.getResultCache()
+        if cache is not None:
+            key = cls.resultCacheKey("round", activityMap, timeTable, groupActivityDF, timeslots, emptySlots, previousSlots)
+            cached = cache.get(key)
+            if cached is not None:
+                logger.info(f"Group round loaded from result cache (hit rate {cache.hitRate:.2f})")
+                return decodeResult(cached)
+
+        if engine == "bruteForce":
+            result = cls.bruteForceGroupScheduling(activityMap, timeTable, timeslots, emptySlots, groupActivityDF, deadline)
+        else:
+            result = cls.solverGroupScheduling(
+                getGroupSolver(engine), activityMap, timeTable, timeslots, emptySlots, groupActivityDF, deadline, previousSlots
+            )
+
+        if cache is not None and not result[3]:
+            cache.put(key, encodeResult(result))
+        return result
+
+    @classmethod
+    def bruteForceGroupScheduling(cls, activityMap, timeTable, timeslots, emptySlots, groupActivityDF, deadline=None):
+        start = time.monotonic()
         timeSlotsArr = [i for i in range(timeslots)]
         minEmptySlots = float('inf')
         optimalTimeTable = {}
-        
+        isOptimal = True
+        nodes = 0
+
+        # the incumbent is kept as an assignment vector (activity index -> timeslot, -1 if unscheduled)
+        # and only expanded into a full timetable once the search ends
+        assignment = [-1] * len(activityMap)
+        optimalAssignment = list(assignment)
 
         def can_schedule(activity, time_slot, timeTable, activityMap):
             for person in activityMap[activity]:
@@ -223,12 +425,19 @@ class GroupActivityScheduler(BaseScheduler):
         def schedule_activities(activity_index, activityList, timeTable, timeSlots, activityMap, groupActivityDF):
             nonlocal minEmptySlots
             nonlocal emptySlots # current number of empty slots
-            nonlocal optimalTimeTable #final result
+            nonlocal optimalAssignment #final result
+            nonlocal nodes
 
             # we choose the timetable that has the min empty slots in total
             if emptySlots < minEmptySlots:
                 minEmptySlots = emptySlots
-                optimalTimeTable = deepcopy(timeTable)
+                optimalAssignment = list(assignment)
+
+            # every node does DataFrame lookups, so the clock read is negligible next to one and is checked at
+            # every node to keep this engine within its budget
+            nodes += 1
+            if deadline is not None and time.monotonic() > deadline:
+                raise SearchTimeout()
 
             # base case we finish all the activities
             if activity_index >= len(activityList):
@@ -258,7 +467,8 @@ class GroupActivityScheduler(BaseScheduler):
                     for person in activityMap[activity]:
                         timeTable[person][ts] = activity
                         emptySlots -= 1
-                    
+                    assignment[activity_index] = ts
+
                     # schedule next activity
                     schedule_activities(activity_index + 1, activityList ,timeTable, timeSlots, activityMap,groupActivityDF)
                         
@@ -266,6 +476,7 @@ class GroupActivityScheduler(BaseScheduler):
                     for person in activityMap[activity]:
                         timeTable[person][ts] = ""  
                         emptySlots += 1
+                    assignment[activity_index] = -1
 
             
 
@@ -274,12 +485,29 @@ class GroupActivityScheduler(BaseScheduler):
 
 
         def runSchedule(activityMap, timeTable, timeSlotsArr, groupActivityDF):
-            nonlocal optimalTimeTable
+            nonlocal optimalTimeTable, isOptimal
             activityList = list(activityMap.keys())
 
 
             logger.info('start scheduling')
-            schedule_activities(0, activityList, timeTable, timeSlotsArr, activityMap, groupActivityDF)
+            try:
+                schedule_activities(0, activityList, timeTable, timeSlotsArr, activityMap, groupActivityDF)
+            except SearchTimeout:
+                # out of time, undo the partial assignment still written in timeTable
+                isOptimal = False
+                for activity, ts in zip(activityList, assignment):
+                    if ts < 0:
+                        continue
+                    for person in activityMap[activity]:
+                        timeTable[person][ts] = ""
+
+            # timeTable is fully backtracked here, rebuild the optimal timetable from it once
+            optimalTimeTable = deepcopy(timeTable)
+            for activity, ts in zip(activityList, optimalAssignment):
+                if ts < 0:
+                    continue
+                for person in activityMap[activity]:
+                    optimalTimeTable[person][ts] = activity
 
             # # Print the scheduled activities for each individual
             # for p, slots in optimalTimeTable.items():
@@ -289,36 +517,119 @@ class GroupActivityScheduler(BaseScheduler):
             logger.info("end scheduling")
 
         runSchedule(activityMap, timeTable, timeSlotsArr,groupActivityDF)
-        return optimalTimeTable, minEmptySlots
+        logger.info(
+            f"group search explored {nodes} nodes in {time.monotonic() - start:.3f}s, "
+            f"{minEmptySlots} empty slots, proven optimal: {isOptimal}"
+        )
+        # brute force is exhaustive, it is only not optimal when it ran out of time
+        return optimalTimeTable, minEmptySlots, isOptimal, not isOptimal
 
     @classmethod
-    def getFixedTimeArr(cls, fixedTimeSlots):
-        fixedTimeArr = fixedTimeSlots.split(",")
+    def solverGroupScheduling(cls, solver, activityMap, timeTable, timeslots, emptySlots, groupActivityDF, deadline=None, previousSlots=None):
+        # Hands the round to a GroupSolver backend in bitset form. The string timetable is only built for
+        # the final assignment.
+        possibleTimeSlots = cls.getPossibleTimeSlots(list(activityMap.keys()), timeslots, groupActivityDF)
+        problem = compileGroupSearchProblem(activityMap, timeTable, timeslots, possibleTimeSlots)
+        warmStart = repairAssignment(problem, previousSlots) if previousSlots else None
+
+        logger.info(f'start scheduling with {solver.name}')
+        selectSolver = partial(cls.selectGroupSolver, solver)
+        if cls.config.get("GROUP_SEARCH_DECOMPOSE", True):
+            result = solveByComponents(selectSolver, problem, emptySlots, deadline, warmStart)
+        else:
+            result = solveWithWarmStart(selectSolver(problem), problem, emptySlots, deadline, warmStart)
+        logger.info(
+            f"group search explored {result.nodes} nodes in {result.elapsed:.3f}s, "
+            f"{result.emptySlots} empty slots, proven optimal: {result.isOptimal}, timed out: {result.timedOut}"
+        )
 
-        timeSlotMappingReverse = {}
-        for i , slot in enumerate(cls.config["GROUP_TIMESLOT_MAPPING"]):
-            timeSlotMappingReverse[slot] = i
+        return buildTimeTable(problem, timeTable, result.assignment), result.emptySlots, result.isOptimal, result.timedOut
 
-        # Reformat data
-        for i in range(len(fixedTimeArr)):
-            value = fixedTimeArr[i]
-            valueArr = value.split("-")
-            day = int(valueArr[0])
-            slot = int(valueArr[1])
-            fixedTimeArr[i] = timeSlotMappingReverse[(day,slot)]
+    @classmethod
+    def selectGroupSolver(cls, solver, problem):
+        # fall back to the heuristic engine when the search space is too large for the configured solver
+        limit = cls.config.get("GROUP_SEARCH_SPACE_LIMIT_LOG10")
+        if limit is None:
+            return solver
 
-        return fixedTimeArr
+        searchSpace = estimateSearchSpace(problem)
+        if searchSpace <= limit:
+            return solver
 
+        heuristic = getGroupSolver(cls.config.get("GROUP_HEURISTIC_ENGINE", "dsatur"))
+        logger.info(f"search space 10^{searchSpace:.1f} over limit 10^{limit}, using {heuristic.name} instead of {solver.name}")
+        return heuristic
 
-def getAllScheduledActivities(timeTable):
-    activitySet = set()
+    @classmethod
+    def getPossibleTimeSlots(cls, activityList, timeslots, groupActivityDF):
+        # resolve the candidate timeslots of each activity once instead of at every search node
+        possibleTimeSlots = []
+        for activity in activityList:
+            record = groupActivityDF[groupActivityDF["ActivityTitle"] == activity].iloc[0]
 
-    for _, arr in timeTable.items():
-        for a in arr:
-            if a != "-":
-                activitySet.add(a)
+            # for fixed time activity, try all given fixed timeslots
+            if record["IsFixed"]:
+                possibleTimeSlots.append(cls.getFixedTimeArr(record["FixedTimeSlots"]))
+            # for flexible time activity, try all possible timeslots
+            else:
+                possibleTimeSlots.append([i for i in range(timeslots)])
+
+        return possibleTimeSlots
+
+    @classmethod
+    def getFixedTimeArr(cls, fixedTimeSlots):
+        # group timeslot indices of the fixed "d-h" slots
+        return list(fixed_time_slot_indices(fixedTimeSlots, cls.config["GROUP_TIMESLOT_MAPPING"]))
+
+
+@dataclass(kw_only=True, frozen=True)
+class EligibilityMatrices:
+    # patient x activity boolean matrices, rows follow patientIDs and columns follow activityIDs
+    excluded: np.ndarray
+    notRecommended: np.ndarray
+    recommended: np.ndarray
+    liked: np.ndarray
+
+
+def getEligibilityMatrices(patientIDs, activityIDs, groupPreferenceDF, groupRecommendationDF, groupExcludedDF):
+    # one pass over each view instead of querying it once per activity, rows of patients or activities that
+    # are not scheduled are dropped
+    patientIndex = pd.Index(patientIDs)
+    activityIndex = pd.Index(activityIDs)
+
+    def pivot(df):
+        matrix = np.zeros((len(patientIndex), len(activityIndex)), dtype=bool)
+        rows = patientIndex.get_indexer(df["PatientID"])
+        cols = activityIndex.get_indexer(df["CentreActivityID"])
+        found = (rows >= 0) & (cols >= 0)
+        matrix[rows[found], cols[found]] = True
+        return matrix
+
+    doctorRecommendation = groupRecommendationDF["DoctorRecommendation"]
+    return EligibilityMatrices(
+        excluded=pivot(groupExcludedDF),
+        notRecommended=pivot(groupRecommendationDF[doctorRecommendation == False]),
+        recommended=pivot(groupRecommendationDF[doctorRecommendation == True]),
+        liked=pivot(groupPreferenceDF[groupPreferenceDF["IsLike"] == 1]),
+    )
+
+
+def getGroupSlotsFromSchedules(scheduleDF, groupActivityTitles, groupTimeSlotMapping, dayOfWeekOrder):
+    # Reads back the group timeslot of each group activity from written schedules: days are "--" joined
+    # hour slots and medication is appended after " | ". An activity takes the timeslot most patients had it in.
+    votes = defaultdict(Counter)
+    for _, record in scheduleDF.iterrows():
+        for ts, (day, hour) in enumerate(groupTimeSlotMapping):
+            daySchedule = record[dayOfWeekOrder[day]]
+            if not daySchedule:
+                continue
+            slots = daySchedule.split("--")
+            if hour < len(slots):
+                activity = slots[hour].split(" | ")[0]
+                if activity in groupActivityTitles:
+                    votes[activity][ts] += 1
 
-    return activitySet
+    return {activity: counts.most_common(1)[0][0] for activity, counts in votes.items()}
 
 
 def getActivityToTimeSlotMap(timeTable):
@@ -0,0 +1,544 @@
+import math
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+from pear_schedule.db import DB
+
+DEADLINE_CHECK_INTERVAL = 1024  # search nodes between wall clock checks
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+@dataclass(kw_only=True, frozen=True)
+class GroupSearchProblem:
+    # Bitset form of a group scheduling round. Patient i of patientIDs is bit i of every mask.
+    activityList: List[str]
+    patientIDs: List[int]
+    activityMasks: List[int]  # members of each activity
+    activitySizes: List[int]
+    possibleTimeSlots: List[List[int]]  # candidate group timeslots of each activity
+    initialBusy: List[int]  # patients already occupied ("-" or an activity) in each group timeslot
+
+
+@dataclass(kw_only=True)
+class GroupSearchResult:
+    assignment: List[int]  # activity index -> timeslot, -1 if unscheduled
+    emptySlots: int
+    isOptimal: bool  # False if the incumbent is not proven optimal (stopped at the deadline, or a heuristic)
+    nodes: int
+    elapsed: float
+    tableLookups: int = 0
+    tableHits: int = 0
+    timedOut: bool = False  # the deadline cut the search short, so the result depends on when it ran
+
+
+def compileGroupSearchProblem(
+    activityMap: Mapping[str, Set[int]],
+    timeTable: Mapping[int, List[str]],
+    timeslots: int,
+    possibleTimeSlots: List[List[int]],
+) -> GroupSearchProblem:
+    patientIDs = list(timeTable.keys())
+    patientBit = {pid: 1 << i for i, pid in enumerate(patientIDs)}
+
+    initialBusy = [0] * timeslots
+    for pid, arr in timeTable.items():
+        for ts, activity in enumerate(arr):
+            if activity != "":
+                initialBusy[ts] |= patientBit[pid]
+
+    activityList = list(activityMap.keys())
+    activityMasks = []
+    for activity in activityList:
+        mask = 0
+        for pid in activityMap[activity]:
+            mask |= patientBit[pid]
+        activityMasks.append(mask)
+
+    return GroupSearchProblem(
+        activityList=activityList,
+        patientIDs=patientIDs,
+        activityMasks=activityMasks,
+        activitySizes=[mask.bit_count() for mask in activityMasks],
+        possibleTimeSlots=possibleTimeSlots,
+        initialBusy=initialBusy,
+    )
+
+
+def buildTimeTable(
+    problem: GroupSearchProblem,
+    timeTable: Mapping[int, List[str]],
+    assignment: List[int],
+) -> Dict[int, List[str]]:
+    # expand an assignment vector (activity index -> timeslot, -1 if unscheduled) into the string timetable
+    result = deepcopy(timeTable)
+
+    for activity, mask, ts in zip(problem.activityList, problem.activityMasks, assignment):
+        if ts < 0:
+            continue
+        while mask:
+            lowest = mask & -mask
+            result[problem.patientIDs[lowest.bit_length() - 1]][ts] = activity
+            mask ^= lowest
+
+    return result
+
+
+def repairAssignment(problem: GroupSearchProblem, previousSlots: Mapping[str, int]) -> List[int]:
+    # Turns a previous activity -> timeslot mapping (eg. last week's) into a feasible assignment of this
+    # problem: activities keep their old timeslot when it is still possible and clashes with nothing placed
+    # before them, then activities left over take their first free timeslot.
+    assignment = [-1] * len(problem.activityList)
+    busy = list(problem.initialBusy)
+
+    for i, (activity, mask) in enumerate(zip(problem.activityList, problem.activityMasks)):
+        ts = previousSlots.get(activity, -1)
+        if mask and ts in problem.possibleTimeSlots[i] and not busy[ts] & mask:
+            assignment[i] = ts
+            busy[ts] |= mask
+
+    for i, mask in enumerate(problem.activityMasks):
+        if assignment[i] >= 0 or not mask:
+            continue
+        ts = next((ts for ts in problem.possibleTimeSlots[i] if not busy[ts] & mask), -1)
+        if ts >= 0:
+            assignment[i] = ts
+            busy[ts] |= mask
+
+    return assignment
+
+
+def assignmentEmptySlots(problem: GroupSearchProblem, assignment: List[int], emptySlots: int) -> int:
+    return emptySlots - sum(size for size, ts in zip(problem.activitySizes, assignment) if ts >= 0)
+
+
+def estimateSearchSpace(problem: GroupSearchProblem) -> float:
+    # log10 of the number of leaves of the search tree if no activity blocked another: the product over
+    # activities of their feasible timeslot count
+    return sum(
+        math.log10(max(1, sum(1 for ts in set(possibleTimeSlots) if not problem.initialBusy[ts] & mask)))
+        for mask, possibleTimeSlots in zip(problem.activityMasks, problem.possibleTimeSlots) if mask
+    )
+
+
+def independentComponents(problem: GroupSearchProblem) -> List[List[int]]:
+    # Activities sharing no patients never compete for a timeslot, so the round splits into the connected
+    # components of the graph joining activities with a common patient. Components are returned in order
+    # of their first activity, each listing its activity indices in order.
+    components: List[Tuple[int, List[int]]] = []  # (patients of the component, activity indices)
+    for i, mask in enumerate(problem.activityMasks):
+        members, activities = mask, [i]
+        remaining = []
+        for componentMask, componentActivities in components:
+            if componentMask & mask:
+                members |= componentMask
+                activities.extend(componentActivities)
+            else:
+                remaining.append((componentMask, componentActivities))
+        remaining.append((members, activities))
+        components = remaining
+
+    return sorted((sorted(activities) for _, activities in components), key=lambda activities: activities[0])
+
+
+def subProblem(problem: GroupSearchProblem, activityIndices: List[int]) -> GroupSearchProblem:
+    return GroupSearchProblem(
+        activityList=[problem.activityList[i] for i in activityIndices],
+        patientIDs=problem.patientIDs,
+        activityMasks=[problem.activityMasks[i] for i in activityIndices],
+        activitySizes=[problem.activitySizes[i] for i in activityIndices],
+        possibleTimeSlots=[problem.possibleTimeSlots[i] for i in activityIndices],
+        initialBusy=problem.initialBusy,
+    )
+
+
+class TranspositionTable:
+    # Bounded LRU memo of search states. Keys are canonical occupancy fingerprints, values the most slots
+    # still fillable below that state (an upper bound once any part of its subtree was pruned).
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.entries: OrderedDict = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def get(self, key) -> Optional[int]:
+        self.lookups += 1
+        gain = self.entries.get(key)
+        if gain is not None:
+            self.entries.move_to_end(key)
+        return gain
+
+    def store(self, key, gain: int):
+        if key in self.entries:
+            self.entries[key] = min(self.entries[key], gain)
+            self.entries.move_to_end(key)
+            return
+
+        self.entries[key] = gain
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hitRate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class BranchAndBoundSearch:
+    # Depth first search over the same tree as GroupActivityScheduler.bruteForceGroupScheduling.
+    # Only strict improvements replace the incumbent and only branches that cannot strictly improve
+    # are dropped, so the first optimal assignment in search order is returned.
+    def __init__(self, problem: GroupSearchProblem, symmetryBreaking: bool = True, tableSize: int = 0):
+        self.problem = problem
+        self.symmetryBreaking = symmetryBreaking
+        self.table = TranspositionTable(tableSize) if tableSize > 0 else None
+        activityCount = len(problem.activityMasks)
+        timeslots = len(problem.initialBusy)
+
+        # suffixSize[i]: most slots activities i onwards could fill if every one of them is scheduled
+        self.suffixSize = [0] * (activityCount + 1)
+        for i in range(activityCount - 1, -1, -1):
+            self.suffixSize[i] = self.suffixSize[i + 1] + problem.activitySizes[i]
+
+        # suffixLevels[i][k]: patients taking part in more than k of the activities from i onwards
+        # (capped at the number of timeslots, a patient can never fill more than that)
+        self.suffixLevels = [[] for _ in range(activityCount + 1)]
+        for i in range(activityCount - 1, -1, -1):
+            levels = list(self.suffixLevels[i + 1])
+            carry = problem.activityMasks[i]
+            for k in range(len(levels)):
+                levels[k], carry = levels[k] | carry, levels[k] & carry
+            if carry and len(levels) < timeslots:
+                levels.append(carry)
+            self.suffixLevels[i] = levels
+
+        # suffixUnion[i]: patients taking part in any activity from i onwards
+        # suffixSlotActivities[i][ts]: activities from i onwards (as a bitmask) that may use timeslot ts
+        self.suffixUnion = [0] * (activityCount + 1)
+        self.suffixSlotActivities = [[0] * timeslots for _ in range(activityCount + 1)]
+        for i in range(activityCount - 1, -1, -1):
+            self.suffixUnion[i] = self.suffixUnion[i + 1] | problem.activityMasks[i]
+            self.suffixSlotActivities[i] = list(self.suffixSlotActivities[i + 1])
+            for ts in problem.possibleTimeSlots[i]:
+                self.suffixSlotActivities[i][ts] |= 1 << i
+
+    def candidateSlots(self, activity_index: int, busy: List[int]) -> List[int]:
+        # Feasible timeslots for the activity in search order. With symmetry breaking, a timeslot is left
+        # out when an earlier candidate is interchangeable with it: same occupancy for every patient of
+        # the remaining activities and open to the same remaining activities. Its subtree mirrors the
+        # earlier one, so every solution in it has an equally good copy found first.
+        mask = self.problem.activityMasks[activity_index]
+        candidates = [ts for ts in self.problem.possibleTimeSlots[activity_index] if not busy[ts] & mask]
+        if not self.symmetryBreaking or len(candidates) < 2:
+            return candidates
+
+        union = self.suffixUnion[activity_index]
+        slotActivities = self.suffixSlotActivities[activity_index]
+        seen = set()
+        distinct = []
+        for ts in candidates:
+            key = (busy[ts] & union, slotActivities[ts])
+            if key not in seen:
+                seen.add(key)
+                distinct.append(ts)
+
+        return distinct
+
+    def stateKey(self, activity_index: int, busy: List[int]) -> Tuple:
+        # Subtrees below two states at the same depth are identical up to renaming timeslots when every
+        # timeslot of one can be matched with a timeslot of the other open to the same remaining activities
+        # and with the same occupancy for the patients of those activities.
+        union = self.suffixUnion[activity_index]
+        slotActivities = self.suffixSlotActivities[activity_index]
+        return (activity_index, tuple(sorted((slotActivities[ts], occupied & union) for ts, occupied in enumerate(busy))))
+
+    def search(
+        self,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        startIndex: int = 0,
+        assignment: Optional[List[int]] = None,
+        sharedBest = None,
+        incumbent: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        # Searches the subtree below the node reached by assigning activities before startIndex as given
+        # in assignment. If deadline (time.monotonic() value) passes, the best assignment found so far
+        # is returned instead. sharedBest is an optional multiprocessing value holding the best empty
+        # slot count found by any other subtree, branches that cannot at least tie it are dropped.
+        # incumbent is an optional feasible assignment (eg. a warm start) to beat, it is returned unless
+        # the search finds a strictly better one.
+        start = time.monotonic()
+        problem = self.problem
+        masks = problem.activityMasks
+        sizes = problem.activitySizes
+        suffixSize = self.suffixSize
+        suffixLevels = self.suffixLevels
+        activityCount = len(masks)
+        timeslots = len(problem.initialBusy)
+
+        assignment = list(assignment) if assignment is not None else [-1] * activityCount
+        busy = list(problem.initialBusy)
+        for activity_index, ts in enumerate(assignment):
+            if ts >= 0:
+                busy[ts] |= masks[activity_index]
+
+        bestAssignment = list(assignment)
+        minEmptySlots = float('inf')
+        if incumbent is not None:
+            bestAssignment = list(incumbent)
+            minEmptySlots = assignmentEmptySlots(problem, incumbent, emptySlots + sum(
+                size for size, ts in zip(sizes, assignment) if ts >= 0
+            ))
+        nodes = 0
+        table = self.table
+        tableLookups, tableHits = (table.lookups, table.hits) if table is not None else (0, 0)
+
+        def optimistic_bound(activity_index):
+            # a patient fills at most one slot per remaining activity and never more than their free slots,
+            # ie. sum over patients of min(remaining activities, free slots) counted level by level
+            levels = suffixLevels[activity_index]
+            if not levels:
+                return 0
+
+            freeAtLeast = [0] * len(levels)  # freeAtLeast[k]: patients with more than k free slots
+            for ts in range(timeslots):
+                free = levels[0] & ~busy[ts]
+                for k in range(len(levels) - 1, 0, -1):
+                    freeAtLeast[k] |= freeAtLeast[k - 1] & free
+                freeAtLeast[0] |= free
+
+            return sum((level & freeAtLeast[k]).bit_count() for k, level in enumerate(levels))
+
+        def can_prune(activity_index):
+            if emptySlots - suffixSize[activity_index] >= minEmptySlots:
+                return True
+
+            reachable = emptySlots - optimistic_bound(activity_index)
+            if reachable >= minEmptySlots:
+                return True
+            # strict so a subtree holding an equally good solution earlier in search order is kept
+            return sharedBest is not None and reachable > sharedBest.value
+
+        def subtree_floor():
+            # no solution in a completed subtree goes below the incumbent, or below the shared best + 1
+            # where branches were dropped for not at least tying it
+            if sharedBest is None:
+                return minEmptySlots
+            return min(minEmptySlots, sharedBest.value + 1)
+
+        def schedule_activities(activity_index):
+            nonlocal minEmptySlots, emptySlots, bestAssignment, nodes
+
+            if emptySlots < minEmptySlots:
+                minEmptySlots = emptySlots
+                bestAssignment = list(assignment)
+                if sharedBest is not None:
+                    with sharedBest.get_lock():
+                        sharedBest.value = min(sharedBest.value, emptySlots)
+
+            nodes += 1
+            if deadline is not None and nodes % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                raise SearchTimeout()
+
+            if activity_index >= activityCount or can_prune(activity_index):
+                return
+
+            if table is None:
+                branch(activity_index)
+                return
+
+            key = self.stateKey(activity_index, busy)
+            gain = table.get(key)
+            if gain is not None:
+                reachable = emptySlots - gain
+                if reachable >= minEmptySlots or (sharedBest is not None and reachable > sharedBest.value):
+                    table.hits += 1
+                    return
+
+            stateEmptySlots = emptySlots
+            branch(activity_index)
+            table.store(key, stateEmptySlots - subtree_floor())
+
+        def branch(activity_index):
+            nonlocal emptySlots
+
+            mask = masks[activity_index]
+            size = sizes[activity_index]
+            candidates = self.candidateSlots(activity_index, busy)
+
+            for ts in candidates:
+                busy[ts] |= mask
+                assignment[activity_index] = ts
+                emptySlots -= size
+
+                schedule_activities(activity_index + 1)
+
+                busy[ts] ^= mask
+                assignment[activity_index] = -1
+                emptySlots += size
+
+                if can_prune(activity_index):
+                    return
+
+            if not candidates: # activity cannot be scheduled anymore, skip to next activity
+                schedule_activities(activity_index + 1)
+
+        isOptimal = True
+        try:
+            schedule_activities(startIndex)
+        except SearchTimeout:
+            isOptimal = False
+
+        if table is not None:
+            tableLookups, tableHits = table.lookups - tableLookups, table.hits - tableHits
+
+        return GroupSearchResult(
+            assignment=bestAssignment,
+            emptySlots=minEmptySlots,
+            isOptimal=isOptimal,
+            nodes=nodes,
+            elapsed=time.monotonic() - start,
+            tableLookups=tableLookups,
+            tableHits=tableHits,
+            timedOut=not isOptimal,
+        )
+
+
+def branchAndBound(
+    problem: GroupSearchProblem,
+    emptySlots: int,
+    deadline: Optional[float] = None,
+    symmetryBreaking: bool = True,
+    tableSize: int = 0,
+    incumbent: Optional[List[int]] = None,
+) -> GroupSearchResult:
+    return BranchAndBoundSearch(problem, symmetryBreaking, tableSize).search(emptySlots, deadline, incumbent=incumbent)
+
+
+def constrainedActivityOrder(problem: GroupSearchProblem) -> GroupSearchProblem:
+    # Reorders activities so the search branches on the most constrained first: fewest feasible timeslots
+    # (fixed time activities usually have the fewest) then largest participant set. The search tree only
+    # skips an activity when it has no feasible timeslot left, so the order can change the result.
+    def constraint(i):
+        mask = problem.activityMasks[i]
+        feasible = sum(1 for ts in problem.possibleTimeSlots[i] if not problem.initialBusy[ts] & mask)
+        return (feasible, -problem.activitySizes[i], i)
+
+    order = sorted(range(len(problem.activityList)), key=constraint)
+
+    return GroupSearchProblem(
+        activityList=[problem.activityList[i] for i in order],
+        patientIDs=problem.patientIDs,
+        activityMasks=[problem.activityMasks[i] for i in order],
+        activitySizes=[problem.activitySizes[i] for i in order],
+        possibleTimeSlots=[problem.possibleTimeSlots[i] for i in order],
+        initialBusy=problem.initialBusy,
+    )
+
+
+def enumerateSubtrees(search: BranchAndBoundSearch, emptySlots: int, splitDepth: int) -> List[Tuple[bool, List[int], int]]:
+    # Walks the first splitDepth levels of the search tree in the order the serial search visits them.
+    # Returns (isSubtree, assignment, emptySlots) for every node visited: nodes above splitDepth are
+    # candidates on their own, nodes at splitDepth are the roots of subtrees to be searched.
+    problem = search.problem
+    masks = problem.activityMasks
+    splitDepth = min(splitDepth, len(masks))
+    busy = list(problem.initialBusy)
+    assignment = [-1] * len(masks)
+    nodes = []
+
+    def walk(activity_index, emptySlots):
+        if activity_index >= splitDepth:
+            nodes.append((True, list(assignment), emptySlots))
+            return
+        nodes.append((False, list(assignment), emptySlots))
+
+        mask = masks[activity_index]
+        candidates = search.candidateSlots(activity_index, busy)
+        for ts in candidates:
+            busy[ts] |= mask
+            assignment[activity_index] = ts
+            walk(activity_index + 1, emptySlots - problem.activitySizes[activity_index])
+            busy[ts] ^= mask
+            assignment[activity_index] = -1
+
+        if not candidates:
+            walk(activity_index + 1, emptySlots)
+
+    walk(0, emptySlots)
+    return nodes
+
+
+_workerSearch: Optional[BranchAndBoundSearch] = None
+_workerSharedBest = None
+
+
+def _initSearchWorker(problem: GroupSearchProblem, symmetryBreaking: bool, tableSize: int, sharedBest):
+    global _workerSearch, _workerSharedBest
+    DB.dispose_inherited()
+    _workerSearch = BranchAndBoundSearch(problem, symmetryBreaking, tableSize)
+    _workerSharedBest = sharedBest
+
+
+def _searchSubtree(startIndex: int, assignment: List[int], emptySlots: int, deadline: Optional[float]) -> GroupSearchResult:
+    if deadline is not None and time.monotonic() > deadline:
+        return GroupSearchResult(assignment=assignment, emptySlots=emptySlots, isOptimal=False, nodes=1, elapsed=0, timedOut=True)
+
+    return _workerSearch.search(emptySlots, deadline, startIndex, assignment, _workerSharedBest)
+
+
+def parallelBranchAndBound(
+    problem: GroupSearchProblem,
+    emptySlots: int,
+    deadline: Optional[float] = None,
+    workers: int = 2,
+    splitDepth: int = 2,
+    symmetryBreaking: bool = True,
+    tableSize: int = 0,
+    incumbent: Optional[List[int]] = None,
+) -> GroupSearchResult:
+    # Splits the search tree at splitDepth and searches the subtrees in a process pool. Workers share
+    # the best empty slot count found so far for pruning. Results are reduced in serial search order
+    # keeping the first strictly best one, so the assignment is the same as branchAndBound's. Each worker
+    # keeps its own transposition table across the subtrees it searches.
+    start = time.monotonic()
+    nodes = enumerateSubtrees(BranchAndBoundSearch(problem, symmetryBreaking), emptySlots, splitDepth)
+    startIndex = min(splitDepth, len(problem.activityMasks))
+
+    best = GroupSearchResult(assignment=[], emptySlots=float('inf'), isOptimal=True, nodes=0, elapsed=0)
+    if incumbent is not None:
+        best.assignment, best.emptySlots = list(incumbent), assignmentEmptySlots(problem, incumbent, emptySlots)
+    sharedBest = multiprocessing.Value("q", min(best.emptySlots, *(e for _, _, e in nodes)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initSearchWorker, initargs=(problem, symmetryBreaking, tableSize, sharedBest)) as executor:
+        futures = [
+            executor.submit(_searchSubtree, startIndex, assignment, e, deadline) if isSubtree else None
+            for isSubtree, assignment, e in nodes
+        ]
+
+        for (isSubtree, assignment, e), future in zip(nodes, futures):
+            if not isSubtree:
+                best.nodes += 1
+                if e < best.emptySlots:
+                    best.assignment, best.emptySlots = assignment, e
+                continue
+
+            result = future.result()
+            best.nodes += result.nodes
+            best.tableLookups += result.tableLookups
+            best.tableHits += result.tableHits
+            best.isOptimal = best.isOptimal and result.isOptimal
+            best.timedOut = best.timedOut or result.timedOut
+            if result.emptySlots < best.emptySlots:
+                best.assignment, best.emptySlots = result.assignment, result.emptySlots
+
+    best.elapsed = time.monotonic() - start
+    return best
@@ -0,0 +1,341 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from pear_schedule.scheduler.groupSearch import GroupSearchProblem, GroupSearchResult, assignmentEmptySlots, branchAndBound, constrainedActivityOrder, independentComponents, parallelBranchAndBound, subProblem
+from pear_schedule.utils import ConfigDependant
+
+logger = logging.getLogger(__name__)
+
+GROUP_SOLVERS: Mapping[str, "GroupSolver"] = {}
+
+
+class GroupSolver(ConfigDependant):
+    # Backend solving one group scheduling round given in bitset form. Subclasses register themselves
+    # under their name, which is what GROUP_SCHEDULING_ENGINE selects.
+    name: str
+
+    def __init_subclass__(cls) -> None:
+        super().__init_subclass__()
+        GROUP_SOLVERS[cls.name] = cls
+
+    @classmethod
+    def solve(
+        cls,
+        problem: GroupSearchProblem,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        warmStart: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        # warmStart is an optional feasible assignment to start from, eg. last week's timeslots repaired
+        raise NotImplementedError(f"solve not defined for {cls.__name__}")
+
+
+def getGroupSolver(name: str) -> GroupSolver:
+    if name not in GROUP_SOLVERS:
+        raise ValueError(f"Unknown GROUP_SCHEDULING_ENGINE {name}")
+    return GROUP_SOLVERS[name]
+
+
+def solveWithWarmStart(
+    solver: GroupSolver,
+    problem: GroupSearchProblem,
+    emptySlots: int,
+    deadline: Optional[float] = None,
+    warmStart: Optional[List[int]] = None,
+) -> GroupSearchResult:
+    # the warm start is kept when the solver (eg. a heuristic, or one stopped at its deadline) does worse,
+    # so a warm started round is never worse than a cold one
+    result = solver.solve(problem, emptySlots, deadline, warmStart)
+    if warmStart is not None:
+        warmEmptySlots = assignmentEmptySlots(problem, warmStart, emptySlots)
+        if warmEmptySlots < result.emptySlots:
+            result.assignment, result.emptySlots = list(warmStart), warmEmptySlots
+
+    return result
+
+
+def solveByComponents(
+    selectSolver: Callable[[GroupSearchProblem], GroupSolver],
+    problem: GroupSearchProblem,
+    emptySlots: int,
+    deadline: Optional[float] = None,
+    warmStart: Optional[List[int]] = None,
+) -> GroupSearchResult:
+    # Solves every independent component of the round on its own, with the solver selectSolver picks for it,
+    # and merges the assignments. The optimum of the round is the sum of the component optima, and the first
+    # optimum in search order of the whole tree is made of the first optimum of each component, so the
+    # result does not change as long as the solvers are exact.
+    components = independentComponents(problem)
+    if len(components) <= 1:
+        return solveWithWarmStart(selectSolver(problem), problem, emptySlots, deadline, warmStart)
+
+    logger.info(f"group round split into {len(components)} components, largest has {max(map(len, components))} activities")
+    merged = GroupSearchResult(assignment=[-1] * len(problem.activityList), emptySlots=emptySlots, isOptimal=True, nodes=0, elapsed=0)
+    start = time.monotonic()
+    for activityIndices in components:
+        component = subProblem(problem, activityIndices)
+        componentWarmStart = [warmStart[i] for i in activityIndices] if warmStart is not None else None
+        result = solveWithWarmStart(selectSolver(component), component, emptySlots, deadline, componentWarmStart)
+
+        for i, ts in zip(activityIndices, result.assignment):
+            merged.assignment[i] = ts
+        merged.emptySlots -= emptySlots - result.emptySlots
+        merged.isOptimal = merged.isOptimal and result.isOptimal
+        merged.timedOut = merged.timedOut or result.timedOut
+        merged.nodes += result.nodes
+        merged.tableLookups += result.tableLookups
+        merged.tableHits += result.tableHits
+
+    merged.elapsed = time.monotonic() - start
+    return merged
+
+
+class BranchAndBoundSolver(GroupSolver):
+    name = "branchAndBound"
+
+    @classmethod
+    def solve(
+        cls,
+        problem: GroupSearchProblem,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        warmStart: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        searchProblem = problem
+        if cls.config.get("GROUP_SEARCH_ACTIVITY_ORDER", "insertion") == "constrained":
+            searchProblem = constrainedActivityOrder(problem)
+        if warmStart is not None and searchProblem is not problem:
+            problemIndex = {activity: i for i, activity in enumerate(problem.activityList)}
+            warmStart = [warmStart[problemIndex[activity]] for activity in searchProblem.activityList]
+        symmetryBreaking = cls.config.get("GROUP_SEARCH_SYMMETRY_BREAKING", True)
+        tableSize = cls.config.get("GROUP_SEARCH_TRANSPOSITION_TABLE_SIZE", 0)
+
+        workers = cls.config.get("GROUP_SEARCH_WORKERS", 1)
+        if workers > 1:
+            result = parallelBranchAndBound(
+                searchProblem, emptySlots, deadline, workers, cls.config.get("GROUP_SEARCH_SPLIT_DEPTH", 2), symmetryBreaking, tableSize,
+                warmStart,
+            )
+        else:
+            result = branchAndBound(searchProblem, emptySlots, deadline, symmetryBreaking, tableSize, warmStart)
+
+        if tableSize > 0:
+            hitRate = result.tableHits / result.tableLookups if result.tableLookups else 0.0
+            logger.info(f"transposition table: {result.tableLookups} lookups, hit rate {hitRate:.1%}")
+
+        # map the assignment back to the activity order of the problem given
+        if searchProblem is not problem:
+            searchIndex = {activity: i for i, activity in enumerate(searchProblem.activityList)}
+            result.assignment = [result.assignment[searchIndex[activity]] for activity in problem.activityList]
+
+        return result
+
+
+def buildAssignmentModel(problem: GroupSearchProblem) -> Tuple[List[Tuple[int, int]], List[List[int]]]:
+    # Integer program shared by the exact backends: one binary variable per (activity, timeslot) pair the
+    # activity may use given its fixed timeslots and the "-" routine blocks, returned as a list of pairs.
+    # Clashes are returned as groups of variable indices of which at most one can be chosen: one group per
+    # timeslot and distinct set of activities a patient takes part in there.
+    variables = []
+    for activity, (mask, possibleTimeSlots) in enumerate(zip(problem.activityMasks, problem.possibleTimeSlots)):
+        if not mask:
+            continue
+        for ts in dict.fromkeys(possibleTimeSlots):
+            if not problem.initialBusy[ts] & mask:
+                variables.append((activity, ts))
+
+    members = []
+    for mask in problem.activityMasks:
+        bits = []
+        while mask:
+            lowest = mask & -mask
+            bits.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        members.append(bits)
+
+    patientSlotVariables: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for v, (activity, ts) in enumerate(variables):
+        for patient in members[activity]:
+            patientSlotVariables[(patient, ts)].append(v)
+
+    clashes = {tuple(group) for group in patientSlotVariables.values() if len(group) > 1}
+
+    return variables, [list(group) for group in sorted(clashes)]
+
+
+def _timeLimit(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class CpSatSolver(GroupSolver):
+    name = "cpSat"
+
+    @classmethod
+    def solve(
+        cls,
+        problem: GroupSearchProblem,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        warmStart: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        from ortools.sat.python import cp_model  # optional dependency, only needed for this backend
+
+        start = time.monotonic()
+        variables, clashes = buildAssignmentModel(problem)
+
+        model = cp_model.CpModel()
+        x = [model.NewBoolVar(f"x_{activity}_{ts}") for activity, ts in variables]
+
+        activityVariables = defaultdict(list)
+        for v, (activity, _) in enumerate(variables):
+            activityVariables[activity].append(x[v])
+        for activityVars in activityVariables.values():
+            model.AddAtMostOne(activityVars)
+        for group in clashes:
+            model.AddAtMostOne(x[v] for v in group)
+
+        model.Maximize(sum(problem.activitySizes[activity] * x[v] for v, (activity, _) in enumerate(variables)))
+        if warmStart is not None:
+            for v, (activity, ts) in enumerate(variables):
+                model.AddHint(x[v], warmStart[activity] == ts)
+
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = cls.config.get("GROUP_SOLVER_THREADS", 1)
+        timeLimit = _timeLimit(deadline)
+        if timeLimit is not None:
+            solver.parameters.max_time_in_seconds = timeLimit
+
+        status = solver.Solve(model)
+        assignment = [-1] * len(problem.activityList)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            for v, (activity, ts) in enumerate(variables):
+                if solver.BooleanValue(x[v]):
+                    assignment[activity] = ts
+
+        filled = sum(problem.activitySizes[a] for a, ts in enumerate(assignment) if ts >= 0)
+        return GroupSearchResult(
+            assignment=assignment,
+            emptySlots=emptySlots - filled,
+            isOptimal=status == cp_model.OPTIMAL,
+            nodes=solver.NumBranches(),
+            elapsed=time.monotonic() - start,
+            timedOut=status != cp_model.OPTIMAL and timeLimit is not None, # the empty assignment is always feasible
+        )
+
+
+class PulpSolver(GroupSolver):
+    name = "pulp"
+
+    @classmethod
+    def solve(
+        cls,
+        problem: GroupSearchProblem,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        warmStart: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        import pulp  # optional dependency, only needed for this backend
+
+        start = time.monotonic()
+        variables, clashes = buildAssignmentModel(problem)
+
+        model = pulp.LpProblem("group_scheduling", pulp.LpMaximize)
+        x = [pulp.LpVariable(f"x_{activity}_{ts}", cat=pulp.LpBinary) for activity, ts in variables]
+
+        model += pulp.lpSum(problem.activitySizes[activity] * x[v] for v, (activity, _) in enumerate(variables))
+
+        activityVariables = defaultdict(list)
+        for v, (activity, _) in enumerate(variables):
+            activityVariables[activity].append(x[v])
+        for activityVars in activityVariables.values():
+            model += pulp.lpSum(activityVars) <= 1
+        for group in clashes:
+            model += pulp.lpSum(x[v] for v in group) <= 1
+
+        if warmStart is not None:
+            for v, (activity, ts) in enumerate(variables):
+                x[v].setInitialValue(int(warmStart[activity] == ts))
+
+        timeLimit = _timeLimit(deadline)
+        model.solve(pulp.PULP_CBC_CMD(
+            msg=False,
+            timeLimit=timeLimit,
+            threads=cls.config.get("GROUP_SOLVER_THREADS", 1),
+            warmStart=warmStart is not None,
+        ))
+
+        assignment = [-1] * len(problem.activityList)
+        if model.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            for v, (activity, ts) in enumerate(variables):
+                if x[v].value() is not None and x[v].value() > 0.5:
+                    assignment[activity] = ts
+
+        filled = sum(problem.activitySizes[a] for a, ts in enumerate(assignment) if ts >= 0)
+        return GroupSearchResult(
+            assignment=assignment,
+            emptySlots=emptySlots - filled,
+            isOptimal=model.sol_status == pulp.LpSolutionOptimal,
+            nodes=0,  # CBC does not report its node count through pulp
+            elapsed=time.monotonic() - start,
+            timedOut=model.sol_status != pulp.LpSolutionOptimal and timeLimit is not None,
+        )
+
+
+class DSaturSolver(GroupSolver):
+    # Greedy graph colouring: activities are vertices joined when they share a patient, timeslots are the
+    # colours. The activity with the fewest timeslots left (fixed timeslots, "-" blocks and neighbours
+    # already placed) is coloured next, larger activities first on ties, into the timeslot that the fewest
+    # uncoloured neighbours could still use. Runs in milliseconds but is not exact.
+    name = "dsatur"
+
+    @classmethod
+    def solve(
+        cls,
+        problem: GroupSearchProblem,
+        emptySlots: int,
+        deadline: Optional[float] = None,
+        warmStart: Optional[List[int]] = None,
+    ) -> GroupSearchResult:
+        start = time.monotonic()
+        masks = problem.activityMasks
+        sizes = problem.activitySizes
+        activityCount = len(masks)
+
+        neighbours = [
+            [j for j in range(activityCount) if j != i and masks[i] & masks[j]]
+            for i in range(activityCount)
+        ]
+        feasible = [
+            [ts for ts in dict.fromkeys(possibleTimeSlots) if not problem.initialBusy[ts] & mask]
+            for mask, possibleTimeSlots in zip(masks, problem.possibleTimeSlots)
+        ]
+        upperBound = sum(size for size, slots in zip(sizes, feasible) if slots)
+
+        assignment = [-1] * activityCount
+        uncoloured = {i for i in range(activityCount) if masks[i] and feasible[i]}
+        while uncoloured:
+            activity = min(uncoloured, key=lambda i: (len(feasible[i]), -sizes[i], i))
+            uncoloured.remove(activity)
+            if not feasible[activity]: # every timeslot taken by neighbours, leave unscheduled
+                continue
+
+            openNeighbours = [j for j in neighbours[activity] if j in uncoloured]
+            ts = min(feasible[activity], key=lambda ts: sum(1 for j in openNeighbours if ts in feasible[j]))
+            assignment[activity] = ts
+            for j in openNeighbours:
+                if ts in feasible[j]:
+                    feasible[j].remove(ts)
+
+        filled = sum(size for size, ts in zip(sizes, assignment) if ts >= 0)
+        return GroupSearchResult(
+            assignment=assignment,
+            emptySlots=emptySlots - filled,
+            isOptimal=filled == upperBound, # only proven when every schedulable activity got a timeslot
+            timedOut=False, # deterministic and ignores the deadline, the same problem always gives the same result
+            nodes=activityCount,
+            elapsed=time.monotonic() - start,
+        )
@@ -1,16 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
 import datetime
-from functools import partial
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+import heapq
 import logging
-from typing import Dict, List, Mapping, Optional, Set
+from typing import Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
 
+import numpy as np
 import pandas as pd
 from sqlalchemy import Connection, Result, Select, and_, func, select
 from pear_schedule.db import DB
 
+from pear_schedule.db_utils.utils import parse_fixed_time_slots
 from pear_schedule.db_utils.views import ActivitiesExcludedView, ActivitiesView, DisrecommendedActivitiesView, PatientsUnpreferredView, PatientsView, RecommendedActivitiesView, ValidRoutineActivitiesView
 from pear_schedule.db_utils.writer import ScheduleWriter
 from pear_schedule.scheduler.baseScheduler import BaseScheduler
-from pear_schedule.scheduler.utils import checkActivityExcluded, parseFixedTimeArr, rescheduleActivity
+from pear_schedule.scheduler.utils import FreeSlotIndex, checkDayExcluded, exclusionDayMasks, rescheduleActivity
 from pear_schedule.utils import DBTABLES
 
 
@@ -18,71 +23,95 @@ from pear_schedule.utils import DBTABLES
 logger = logging.getLogger(__name__)
 
 
-def _get_max_enddate(d1, d2):
-    if d1 is None:
-        return d1
-    if d2 is None:
-        return d2
-    return max(d1, d2)
+@dataclass(kw_only=True, slots=True)
+class PatientProfile:
+    # what the individual schedulers need to know about one patient, recommendations are handled in
+    # compulsory scheduling
+    preferences: FrozenSet[int] = frozenset()
+    dispreferences: FrozenSet[int] = frozenset()
+    exclusions: FrozenSet[int] = frozenset()
+    exclusion_ends: Dict[int, Optional[datetime.datetime]] = field(default_factory=dict)  # None if it never ends
+    excluded_days: Dict[int, int] = field(default_factory=dict)  # see exclusionDayMasks
+
+
+def _group_ids(df: pd.DataFrame, column: str) -> Dict[int, FrozenSet[int]]:
+    # PatientID: frozenset of the non null ids in column
+    df = df.dropna(subset=[column])
+    return {
+        pid: frozenset(ids.astype(int).tolist())
+        for pid, ids in df.groupby("PatientID", sort=False)[column]
+    }
+
+
+def _partition_by_patient(df: pd.DataFrame) -> Dict[int, pd.DataFrame]:
+    # PatientID: slice of df with that patient's rows in their original order, from one stable sort
+    df = df.sort_values("PatientID", kind="stable")
+    ids = df["PatientID"].to_numpy()
+    if not len(ids):
+        return {}
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]).tolist()
+    ends = starts[1:] + [len(ids)]
+    return {ids[start]: df.iloc[start:end] for start, end in zip(starts, ends)}
 
 
 class IndividualActivityScheduler(BaseScheduler):
     @classmethod
-    def _get_patient_data(cls, conn: Connection = None, week_end: datetime.datetime = None) -> Mapping[str, Mapping[str, Dict[str, str]]]:
+    def _get_patient_data(
+        cls, 
+        conn: Connection = None, 
+        week_end: datetime.datetime = None, 
+        week_start: datetime.datetime = None
+    ) -> Mapping[int, PatientProfile]:
+        week_start = week_start or \
+            datetime.datetime.now() - datetime.timedelta(days = datetime.datetime.now().weekday())
         if not week_end:
             today = datetime.datetime.now()
             week_end = today - datetime.timedelta(days=today.weekday()) + datetime.timedelta(days=6)
             week_end = week_end.replace(hour=23, minute=59, second=59)
 
-        patients: Mapping[str, Mapping[str, Dict[str, str]]] = {}
-
-        # consolidate patient data
-        for _, p in PatientsView.get_data(conn=conn).iterrows():
-            pid = p["PatientID"]
-            if pid not in patients:
-                patients[pid] = {
-                    "preferences":dict(), "exclusions": dict(), "dispreferences": dict()  # recommendations handled in compulsory scheduling
-                }
-
-            if p["ActivityEndDate"] <= week_end:
-                continue
-
-            patients[pid]["preferences"][p["PreferredActivityID"]] = True
-
-        # add unpreferred activities
-        for _, p in PatientsUnpreferredView.get_data(conn=conn).iterrows():
-            pid = p["PatientID"]
-            if pid not in patients:
-                patients[pid] = {
-                    "preferences":dict(), "exclusions": dict(), "dispreferences": dict()  # recommendations handled in compulsory scheduling
-                }
-
-            patients[pid]["dispreferences"][p["DispreferredActivityID"]] = True
-
-        # add activity exclusions to patient data
-        for _ , e in ActivitiesExcludedView.get_data(conn=conn).iterrows():
-            pid = e["PatientID"]
-            if pid not in patients:
-                patients[pid] = {
-                    "preferences":dict(), "exclusions": dict(), "dispreferences": dict()  # recommendations handled in compulsory scheduling
-                }
-            activity_id = e["ActivityID"]
-            if e["ActivityID"] not in patients[pid]["exclusions"]:
-                patients[pid]["exclusions"][activity_id] = e["EndDateTime"]
-            else:
-                patients[pid]["exclusions"][activity_id] = _get_max_enddate(
-                    e["EndDateTime"], patients[pid]["exclusions"][activity_id]
-                )
+        patients_df = PatientsView.get_data(conn=conn)
+        unpreferred_df = PatientsUnpreferredView.get_data(conn=conn)
+        excluded_df = ActivitiesExcludedView.get_data(conn=conn)
+        disrecommended_df = DisrecommendedActivitiesView.get_data(conn=conn)
+
+        # preferences for activities still running after this week
+        preferences = _group_ids(patients_df[patients_df["ActivityEndDate"] > week_end], "PreferredActivityID")
+        dispreferences = _group_ids(unpreferred_df, "DispreferredActivityID")
+
+        # latest end of each excluded activity, an exclusion without an end date never ends
+        exclusion_ends = {}
+        if not excluded_df.empty:
+            keys = [excluded_df["PatientID"], excluded_df["ActivityID"]]
+            end_dates = pd.to_datetime(excluded_df["EndDateTime"])
+            latest = end_dates.groupby(keys, sort=False).max()
+            never_ends = end_dates.isna().groupby(keys, sort=False).any()
+            for (pid, activity_id), end, endless in zip(latest.index, latest.tolist(), never_ends.tolist()):
+                exclusion_ends.setdefault(pid, {})[activity_id] = None if endless else end.to_pydatetime()
 
         # for the purposes of individual scheduling disrecommendations classified as exclusions also
-        for _, r in DisrecommendedActivitiesView.get_data(conn=conn).iterrows():
-            pid = r["PatientID"]
-            if pid not in patients:
-                patients[pid] = {
-                    "preferences":dict(), "exclusions": dict(), "dispreferences": dict()  # recommendations handled in compulsory scheduling
-                }
-            activity_id = r["ActivityID"]
-            patients[pid]["exclusions"][activity_id] = week_end
+        for pid, activity_ids in _group_ids(disrecommended_df, "ActivityID").items():
+            exclusion_ends.setdefault(pid, {}).update(dict.fromkeys(activity_ids, week_end))
+
+        # every patient in any of the views, in order of first appearance (views are often empty, which
+        # pd.concat warns about)
+        patient_ids = dict.fromkeys(
+            pid
+            for df in (patients_df, unpreferred_df, excluded_df, disrecommended_df)
+            for pid in df["PatientID"].tolist()
+        )
+
+        patients: Mapping[int, PatientProfile] = {}
+        for pid in patient_ids:
+            ends = exclusion_ends.get(pid, {})
+            patients[pid] = PatientProfile(
+                preferences=preferences.get(pid, frozenset()),
+                dispreferences=dispreferences.get(pid, frozenset()),
+                exclusions=frozenset(ends),
+                exclusion_ends=ends,
+                # days of this week each exclusion covers, for the per slot checks of the individual schedulers
+                excluded_days=exclusionDayMasks(ends, week_start),
+            )
 
         return patients
 
@@ -98,113 +127,149 @@ class RecommendedRoutineActivityScheduler(IndividualActivityScheduler):
         with DB.get_engine().begin() as conn:
             # pull recommendations
             recommendations: pd.DataFrame = RecommendedActivitiesView.get_data(conn=conn)
-            recommendations.sort_values(by=["PatientID"])
             recommendations["FixedTimeSlots"] = recommendations["FixedTimeSlots"].astype(str)
 
-            # filter out activities that are not available this week
-            recommendations = recommendations[recommendations["ActivityEndDate"] > week_end]
-
-            # add an extra row at end for easier handling of final patient
-            dummy_row = recommendations.iloc[0:1].copy(deep=True)
-            dummy_row["PatientID"] = None
-            recommendations = pd.concat([recommendations, dummy_row]).reset_index(drop=True)
-
             # get patient level data
-            patients = cls._get_patient_data(conn=conn)
+            patients = cls._get_patient_data(conn=conn, week_start=week_start)
 
             # get routine data
             routines = ValidRoutineActivitiesView.get_data(conn=conn)
 
-            start = 0
+        # everything is read, fill outside the transaction so no worker process inherits it
 
-            for curr, (_, row) in enumerate(recommendations.iterrows()):  # not using iterrows directly since need range indexing later
-                if row["PatientID"] == recommendations.loc[start, "PatientID"]:
-                    continue
-
-                end = curr
+        # filter out activities that are not available this week
+        recommendations = recommendations[recommendations["ActivityEndDate"] > week_end]
+        fixedTimeSlotIdx = (recommendations["FixedTimeSlots"] != "") & (~recommendations["FixedTimeSlots"].isna())
 
-                patient_id = recommendations["PatientID"][start]
-                curr_df: pd.DataFrame = recommendations.iloc[start: end]
-                patient_schedule = schedules[patient_id]
+        # split every table by patient once instead of filtering it again for each patient
+        fixed_by_patient = _partition_by_patient(recommendations[fixedTimeSlotIdx])
+        flexible_by_patient = _partition_by_patient(recommendations[~fixedTimeSlotIdx])
+        routines_by_patient = _partition_by_patient(routines)
+        no_recommendations, no_routines = recommendations.iloc[0:0], routines.iloc[0:0]
 
-                fixedTimeSlotIdx = (curr_df["FixedTimeSlots"] != "") & (~curr_df["FixedTimeSlots"].isna())
-                patient_routine = routines[routines["PatientID"] == patient_id]
+        patient_schedules = {pid: schedules[pid] for pid in pd.unique(recommendations["PatientID"]).tolist()}
+        workers = cls.config.get("INDIVIDUAL_SCHEDULING_WORKERS", 1)
+        if workers > 1:
+            snapshot = (
+                fixed_by_patient, flexible_by_patient, routines_by_patient,
+                {pid: patients[pid] for pid in patient_schedules}, no_recommendations, no_routines,
+            )
+            fill_in_pool(_fill_recommended_chunk, patient_schedules, snapshot, workers, cls.config.get("INDIVIDUAL_SCHEDULING_CHUNK_SIZE", 64))
+            return
 
-                cls.__fillByFixedTimeSlots(patient_schedule, curr_df[fixedTimeSlotIdx], patients[patient_id], week_start)
-                cls.__fillRoutines(patient_schedule, curr_df[fixedTimeSlotIdx], patient_routine, patients[patient_id], week_start)
-                cls.__fillFlexibleActivities(patient_schedule, curr_df[~fixedTimeSlotIdx], patients[patient_id], week_start)
+        for patient_id, patient_schedule in patient_schedules.items():
+            cls.fillPatient(
+                patient_schedule,
+                fixed_by_patient.get(patient_id, no_recommendations),
+                flexible_by_patient.get(patient_id, no_recommendations),
+                routines_by_patient.get(patient_id, no_routines),
+                patients[patient_id],
+            )
 
-                start = end
+    @classmethod
+    def fillPatient(
+        cls, 
+        patient_schedule: List[List[str]], 
+        fixed_activities: pd.DataFrame, 
+        flexible_activities: pd.DataFrame, 
+        patient_routine: pd.DataFrame, 
+        patient_info: PatientProfile,
+    ):
+        free_slots = FreeSlotIndex(patient_schedule)
+        cls.__fillByFixedTimeSlots(patient_schedule, free_slots, fixed_activities, patient_info)
+        cls.__fillRoutines(patient_schedule, free_slots, fixed_activities, patient_routine, patient_info)
+        cls.__fillFlexibleActivities(patient_schedule, free_slots, flexible_activities, patient_info)
     
     @classmethod
     def __fillByFixedTimeSlots(
         cls, 
         patient_schedule: List[str], 
+        free_slots: FreeSlotIndex,
         activities: pd.DataFrame, 
-        patient_info: Mapping[str, Dict[str, str]],
-        week_start: datetime.datetime = None
+        patient_info: PatientProfile,
     ):
-        # set week_start to current week monday if not given
-        week_start = week_start or \
-            datetime.datetime.now() - datetime.timedelta(days = datetime.datetime.now().weekday())
+        # place the most constrained remaining activity (fewest fixed slots left from the current slot) in
+        # each empty slot, activities with no fixed slots left are dropped once seen. Availability only
+        # falls as the scan moves forward, so a heap of (availability, row) is kept in step with it using
+        # each activity's suffix counts, stale entries being skipped when popped.
+        days = len(patient_schedule)
+        hours = len(patient_schedule[0]) if days else 0
+        activity_ids = activities["ActivityID"].tolist()
+        titles = activities["ActivityTitle"].tolist()
+        counts = [fixed_slot_suffix_counts(slots, days, hours) for slots in activities["FixedTimeSlots"]]
+        if not counts or not hours:
+            return
 
-        scheduled_idx = pd.Series(False, index=activities.index)
-        for day, day_schedule in enumerate(patient_schedule):
+        # positions at which each activity's availability drops
+        changes = [[] for _ in range(days * hours)]
+        for i, activity_counts in enumerate(counts):
+            for pos in range(1, days * hours):
+                if activity_counts[pos] != activity_counts[pos - 1]:
+                    changes[pos].append(i)
+
+        heap = [(activity_counts[0], i) for i, activity_counts in enumerate(counts)]
+        heapq.heapify(heap)
+        scheduled = [False] * len(counts)
+        remaining = len(counts)
+        last_pos = 0
 
-            if scheduled_idx.all():
+        for day, day_schedule in enumerate(patient_schedule):
+            if not remaining:
                 break
 
-            for slot, curr_activity in enumerate(day_schedule):
-                if curr_activity:
-                    continue
-                # scan remaining allowed activities to find most constrained
-                # not ideal but no. of activities is expected to be small so O(n2) is acceptable
+            for slot in free_slots.freeSlots(day):
+                pos = day * hours + slot
+                for passed in range(last_pos + 1, pos + 1):
+                    for i in changes[passed]:
+                        if not scheduled[i]:
+                            heapq.heappush(heap, (counts[i][passed], i))
+                last_pos = pos
 
                 least_available = -1
-                lowest_availability = float("inf")
-
-                for row, activity in activities[~scheduled_idx].iterrows():
-                    if checkActivityExcluded(
-                        activity["ActivityID"], patient_info["exclusions"], day, week_start
-                    ):
+                excluded = []
+                while heap:
+                    availability, i = heap[0]
+                    if scheduled[i] or availability != counts[i][pos]:
+                        heapq.heappop(heap)
                         continue
+                    if least_available >= 0 and availability:
+                        break
 
-                    curr_availability = calculate_activity_availabillity(day, slot, activity["FixedTimeSlots"])
+                    heapq.heappop(heap)
+                    if checkDayExcluded(patient_info.excluded_days, activity_ids[i], day):
+                        excluded.append((availability, i))
+                        continue
 
-                    if not curr_availability:
-                        scheduled_idx.loc[row] = True
+                    scheduled[i] = True
+                    remaining -= 1
+                    if least_available < 0:
+                        least_available = i
+                    if availability:
+                        break
 
-                    if curr_availability < lowest_availability:
-                        least_available = row
-                        lowest_availability = curr_availability
+                for entry in excluded:
+                    heapq.heappush(heap, entry)
 
                 if least_available < 0:
                     break
 
-                scheduled_idx.loc[least_available] = True
-
-                day_schedule[slot] = activities.loc[least_available, "ActivityTitle"]
+                day_schedule[slot] = titles[least_available]
+                free_slots.assign(day, slot)
 
     @classmethod
     def __fillRoutines(
         cls, 
         patient_schedule: List[str], 
+        free_slots: FreeSlotIndex,
         activities: pd.DataFrame, 
         patient_routine: pd.DataFrame, 
-        patient_info: Mapping[str, Dict[str, str]],
-        week_start: datetime.datetime = None
+        patient_info: PatientProfile,
     ):
-        # set week_start to current week monday if not given
-        week_start = week_start or \
-            datetime.datetime.now() - datetime.timedelta(days = datetime.datetime.now().weekday())
-        
         # consolidate routines for each time slot (if the routine is not excluded)
         routine_slots = {}
         for _, r in patient_routine.iterrows():
-            for (day, time) in parseFixedTimeArr(r["FixedTimeSlots"]):
-                if checkActivityExcluded(
-                    r["ActivityID"], patient_info["exclusions"], day, week_start
-                ):
+            for (day, time) in parse_fixed_time_slots(r["FixedTimeSlots"]):
+                if checkDayExcluded(patient_info.excluded_days, r["ActivityID"], day):
                     continue
 
                 # potentially if routines clash then it will be overriden
@@ -213,7 +278,7 @@ class RecommendedRoutineActivityScheduler(IndividualActivityScheduler):
 
         # reformate activities for easier lookup
         activity_map = {
-            r["ActivityTitle"]: parseFixedTimeArr(r["FixedTimeSlots"]) 
+            r["ActivityTitle"]: parse_fixed_time_slots(r["FixedTimeSlots"]) 
             for _, r in activities.iterrows()
         }
 
@@ -223,10 +288,12 @@ class RecommendedRoutineActivityScheduler(IndividualActivityScheduler):
 
             if not current_activity:
                 patient_schedule[day][time] = routine_activity_title
+                free_slots.assign(day, time)
                 continue
             
-            if new_slot := rescheduleActivity(patient_schedule, day, time, activity_map[current_activity]):
+            if new_slot := rescheduleActivity(free_slots, activity_map[current_activity]):
                 patient_schedule[new_slot[0]][new_slot[1]] = current_activity
+                free_slots.assign(*new_slot)
                 patient_schedule[day][time] = routine_activity_title
                 continue
 
@@ -234,30 +301,22 @@ class RecommendedRoutineActivityScheduler(IndividualActivityScheduler):
     def __fillFlexibleActivities(
         cls, 
         patient_schedule: List[str], 
+        free_slots: FreeSlotIndex,
         activities: pd.DataFrame, 
-        patient_info: Mapping[str, Dict[str, str]],
-        week_start: datetime.datetime = None
+        patient_info: PatientProfile,
     ):
-        # set week_start to current week monday if not given
-        week_start = week_start or \
-            datetime.datetime.now() - datetime.timedelta(days = datetime.datetime.now().weekday())
-
         # prevent scheduling more than necessary
         scheduled_activities = set()
 
-        for day, day_schedule in enumerate(patient_schedule):
-            for time, existing_activity in enumerate(day_schedule):
-                if existing_activity:
-                    continue
-
+        for day in range(len(patient_schedule)):
+            for time in free_slots.freeSlots(day):
                 for _, a in activities.iterrows():
                     if a["ActivityID"] in scheduled_activities or \
-                        checkActivityExcluded(
-                            a["ActivityID"], patient_info["exclusions"], day, week_start
-                    ):
+                        checkDayExcluded(patient_info.excluded_days, a["ActivityID"], day):
                         continue
 
                     patient_schedule[day][time] = a["ActivityTitle"]
+                    free_slots.assign(day, time)
                     scheduled_activities.add(a["ActivityTitle"])
 
                 if len(scheduled_activities) == len(activities):
@@ -270,100 +329,105 @@ class PreferredActivityScheduler(IndividualActivityScheduler):
         cls.fillPreferences(schedules)
 
     @classmethod
-    def fillPreferences(cls, schedules: Mapping[str, List[str]], conn: Connection = None, patients: Mapping = None):
+    def fillPreferences(
+        cls,
+        schedules: Mapping[str, List[str]],
+        conn: Connection = None,
+        patients: Mapping[int, PatientProfile] = None,
+        week_start: datetime.date = None,
+    ):
         patients = patients or cls._get_patient_data(conn=conn)
 
         # consolidate activity data
         activities: pd.DataFrame = ActivitiesView.get_data(conn=conn)  # non compulsory individual activities
-        # activities = activities.sample(frac=1)\
-        #     .reset_index(drop=True)
+        catalogue = ActivityCatalogue.from_df(activities)
 
+        known_schedules = {}
         for pid, sched in schedules.items():
             if pid not in patients:
                 logger.error(f"unknown patientID {pid} found in schedules")
                 continue
-            patient = patients[pid]
-
-            exclusions: Set[str] = patient["exclusions"]
-            preferences: Set[str] = patient["preferences"]
-            dispreferences: Set[str] = patient["dispreferences"]
-
-            avail_activities = activities[~activities["ActivityID"].isin(exclusions)]
-            avail_activities = avail_activities[["ActivityID", "ActivityTitle", "FixedTimeSlots", "MinDuration", "MaxDuration"]]
-
-            preference_idx = avail_activities["ActivityID"].isin(preferences)
-            non_preference_idx = (~avail_activities["ActivityID"].isin(dispreferences)) & ~preference_idx
-            preferred_activities = avail_activities[preference_idx]
-            non_preferred_activites = avail_activities[non_preference_idx]
-
-            for day, day_sched in enumerate(sched):
-                curr_day_activities = set()
-
-                i = 0
-                while i < len(day_sched):
-                    if not day_sched[i]:
-                        j = i + 1
-                        while (j < len(day_sched) and not day_sched[j]):
-                            j += 1
-                        if i >= len(day_sched):
-                            break
-
-                        find_activity = partial(cls.__findActivityBySlot, day=day, slot=i, slot_size=j-i)
-                        new_activity = \
-                            find_activity(preferred_activities, curr_day_activities) or \
-                            find_activity(non_preferred_activites, curr_day_activities)
-
-                        if not new_activity:
-                            new_activity = "Free and Easy"
-                        curr_day_activities.add(new_activity)
-                        day_sched[i] = new_activity
-                    i += 1
+            known_schedules[pid] = sched
+
+        # candidates are tried in a random order seeded per patient and week, so a run is reproducible
+        # whichever process fills the patient while ties still go a different way from one week to the next
+        seed = cls.config.get("PREFERENCE_SHUFFLE_SEED")
+        week = schedule_week(week_start or datetime.date.today())
+        workers = cls.config.get("INDIVIDUAL_SCHEDULING_WORKERS", 1)
+        if workers > 1:
+            snapshot = (catalogue, {pid: patients[pid] for pid in known_schedules}, seed, week)
+            fill_in_pool(_fill_preferences_chunk, known_schedules, snapshot, workers, cls.config.get("INDIVIDUAL_SCHEDULING_CHUNK_SIZE", 64))
+            return
+
+        for pid, sched in known_schedules.items():
+            cls.fillPatientPreferences(sched, patients[pid], catalogue, patient_rng(seed, week, pid))
+
+    @classmethod
+    def fillPatientPreferences(cls, sched: List[List[str]], patient: PatientProfile, catalogue: "ActivityCatalogue", rng: np.random.Generator):
+        avail = catalogue.all & ~catalogue.bitset(patient.exclusions)
+        preferred = avail & catalogue.bitset(patient.preferences)
+        non_preferred = avail & ~catalogue.bitset(patient.dispreferences) & ~preferred
+        preferred_activities = catalogue.positions(preferred)
+        non_preferred_activites = catalogue.positions(non_preferred)
+
+        free_slots = FreeSlotIndex(sched)
+        for day, day_sched in enumerate(sched):
+            curr_day_activities = set()
+            preferred_order = rng.permutation(preferred_activities).tolist()
+            non_preferred_order = rng.permutation(non_preferred_activites).tolist()
+
+            # fill the first slot of each gap, the rest of the gap is a smaller gap after it
+            while gap := free_slots.nextGap(day):
+                i, slot_size = gap
+                find_activity = partial(cls.__findActivityBySlot, catalogue, day=day, slot=i, slot_size=slot_size)
+                new_activity = \
+                    find_activity(preferred_order, curr_day_activities) or \
+                    find_activity(non_preferred_order, curr_day_activities)
+
+                if not new_activity:
+                    new_activity = "Free and Easy"
+                curr_day_activities.add(new_activity)
+                day_sched[i] = new_activity
+                free_slots.assign(day, i)
 
     @classmethod
     def __findActivityBySlot(
         cls, 
-        activities: pd.DataFrame, 
+        catalogue: "ActivityCatalogue",
+        candidates: List[int], 
         used_activities: Set[str], 
         day: int, 
         slot: int,
         slot_size: int,
     ) -> Optional[str]:
-        if activities.empty:
-            return
-        
-        activities = activities.sample(frac=1)\
-            .reset_index(drop=True)
-        
+        # candidates are positions in catalogue, in the order they should be tried
         out = [-1, 1000, False]
 
-        for i, a in activities.iterrows():
-            if a["ActivityTitle"] in used_activities:
+        for i in candidates:
+            if catalogue.titles[i] in used_activities:
                 continue
 
-            minDuration = max(1, a["MinDuration"])
-
-            if a["FixedTimeSlots"]:
-                timeSlots = map(lambda x: x.split("-"), a["FixedTimeSlots"].split(","))
-                timeSlots = [t for t in timeSlots if t[0] == day and t[1] == slot and t[1] + minDuration < slot + slot_size]
+            minDuration = catalogue.min_durations[i]
+            fixed_slots = catalogue.fixed_slots[i]
 
-                if not timeSlots:
+            if fixed_slots is not None:
+                if (day, slot) not in fixed_slots or minDuration >= slot_size:
                     continue
-                else:
-                    earliest_end = min(t[1] + minDuration for t in timeSlots)
+                earliest_end = slot + minDuration
             else:
                 if out[2]:
                     continue
                 earliest_end = slot + minDuration
 
-            if earliest_end < out[1] and bool(a["FixedTimeSlots"]) >= out[2]:
+            if earliest_end < out[1] and (fixed_slots is not None) >= out[2]:
                 out[0] = i
                 out[1] = earliest_end
-                out[2] = bool(a["FixedTimeSlots"])
+                out[2] = fixed_slots is not None
         
         if out[0] < 0:
             return None
 
-        return activities.iloc[out[0]]["ActivityTitle"]
+        return catalogue.titles[out[0]]
 
     @classmethod
     def getMostUpdatedSchedules(
@@ -435,7 +499,7 @@ class PreferredActivityScheduler(IndividualActivityScheduler):
 
             def check_excluded(pid, activityTitle):
                 activityTitle = activityTitle.strip()
-                return activities_title_lookup.get(activityTitle, None) in patient_data[pid]["exclusions"]
+                return activities_title_lookup.get(activityTitle, None) in patient_data[pid].exclusions
 
             formatted_schedules = {}
             schedule_meta = {}
@@ -454,7 +518,7 @@ class PreferredActivityScheduler(IndividualActivityScheduler):
                     "EndDate": row["EndDate"],
                 }
 
-            cls.fillPreferences(formatted_schedules, conn, patient_data)
+            cls.fillPreferences(formatted_schedules, conn, patient_data, week_start=update_date)
 
             # recombine the updated and original schedules
             for _, row in latest_schedules.iterrows():
@@ -475,16 +539,134 @@ class PreferredActivityScheduler(IndividualActivityScheduler):
 
 
 
+@dataclass(kw_only=True, frozen=True)
+class ActivityCatalogue:
+    # ActivitiesView columns read when filling preferences, indexed by row position. Sets of activities
+    # are bitsets over the positions (bit i for row i).
+    id_masks: Dict[int, int]  # ActivityID: bitset of its rows
+    titles: List[str]
+    min_durations: List[int]
+    fixed_slots: List[Optional[FrozenSet[Tuple[int, int]]]]  # None for activities without fixed slots
+
+    @classmethod
+    def from_df(cls, activities: pd.DataFrame) -> "ActivityCatalogue":
+        min_durations = activities["MinDuration"].to_numpy(dtype=float)
+        id_masks = {}
+        for i, activity_id in enumerate(activities["ActivityID"].tolist()):
+            id_masks[activity_id] = id_masks.get(activity_id, 0) | 1 << i
+
+        return cls(
+            id_masks=id_masks,
+            titles=activities["ActivityTitle"].tolist(),
+            min_durations=np.where(min_durations > 1, min_durations, 1).astype(int).tolist(),
+            fixed_slots=[
+                frozenset(parse_fixed_time_slots(slots)) if isinstance(slots, str) and slots else None
+                for slots in activities["FixedTimeSlots"]
+            ],
+        )
+
+    @property
+    def all(self) -> int:
+        return (1 << len(self.titles)) - 1
+
+    def bitset(self, activity_ids) -> int:
+        mask = 0
+        for activity_id in activity_ids:
+            mask |= self.id_masks.get(activity_id, 0)
+        return mask
+
+    @staticmethod
+    def positions(mask: int) -> np.ndarray:
+        # rows in the bitset in ascending order
+        positions = []
+        while mask:
+            lowest = mask & -mask
+            positions.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return np.array(positions, dtype=np.intp)
+
+
+def schedule_week(date: datetime.date) -> int:
+    # proleptic ordinal of the Monday of date's week, the same for every day of the week
+    return (date - datetime.timedelta(days=date.weekday())).toordinal()
+
+
+def patient_rng(seed: Optional[int], week: int, patient_id: int) -> np.random.Generator:
+    # independent stream per patient so the order patients are filled in does not change their schedules
+    return np.random.default_rng(None if seed is None else [seed, week, patient_id])
+
+
+_worker_snapshot = None
+
+
+def _init_individual_worker(snapshot):
+    global _worker_snapshot
+    # update_schedules fills preferences inside its transaction, never reuse the parent's connections
+    DB.dispose_inherited()
+    _worker_snapshot = snapshot
+
+
+def _fill_recommended_chunk(chunk):
+    fixed_by_patient, flexible_by_patient, routines_by_patient, patients, no_recommendations, no_routines = _worker_snapshot
+    for patient_id, patient_schedule in chunk:
+        RecommendedRoutineActivityScheduler.fillPatient(
+            patient_schedule,
+            fixed_by_patient.get(patient_id, no_recommendations),
+            flexible_by_patient.get(patient_id, no_recommendations),
+            routines_by_patient.get(patient_id, no_routines),
+            patients[patient_id],
+        )
+    return chunk
+
+
+def _fill_preferences_chunk(chunk):
+    catalogue, patients, seed, week = _worker_snapshot
+    for pid, sched in chunk:
+        PreferredActivityScheduler.fillPatientPreferences(sched, patients[pid], catalogue, patient_rng(seed, week, pid))
+    return chunk
+
+
+def fill_in_pool(fill_chunk, schedules: Mapping[int, List[List[str]]], snapshot, workers: int, chunk_size: int):
+    # Fills schedules in chunks of patients in a process pool. The read only snapshot the chunks are filled
+    # from is handed to each worker once as it starts (inherited without copying when processes fork), only
+    # the schedules travel per chunk. Filled schedules are copied back into the caller's lists.
+    items = list(schedules.items())
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_individual_worker, initargs=(snapshot,)) as executor:
+        for filled in executor.map(fill_chunk, chunks):
+            for pid, schedule in filled:
+                for day, day_schedule in enumerate(schedule):
+                    schedules[pid][day][:] = day_schedule
+
+
+@lru_cache(maxsize=4096)
+def fixed_slot_suffix_counts(fixedTimeSlots: str, days: int, hours: int) -> Tuple[int, ...]:
+    # calculate_activity_availabillity(day, slot, fixedTimeSlots) for every slot of the week, indexed by
+    # day * hours + slot
+    if not fixedTimeSlots:
+        return (1000,) * (days * hours)
+
+    time_slots = sorted(parse_fixed_time_slots(fixedTimeSlots))
+    counts = []
+    passed = 0
+    for day in range(days):
+        for slot in range(hours):
+            while passed < len(time_slots) and time_slots[passed] < (day, slot):
+                passed += 1
+            counts.append(len(time_slots) - passed)
+
+    return tuple(counts)
+
+
 def calculate_activity_availabillity(day: int, slot: int, fixedTimeSlots: str):
     if not fixedTimeSlots:
         return 1000
 
-    time_slots = fixedTimeSlots.split(",")
-
-    def validate(ts: str):
-        d, s = ts.split("-")
-        return int(d) > day or (int(d) == day and int(s) >= slot)
+    def validate(ts):
+        d, s = ts
+        return d > day or (d == day and s >= slot)
     
-    tally = sum(map(validate, time_slots))
+    tally = sum(map(validate, parse_fixed_time_slots(fixedTimeSlots)))
     
     return tally
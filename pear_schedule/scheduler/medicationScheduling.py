@@ -1,82 +1,81 @@
 import datetime
-from typing import List, Mapping
+import logging
+from typing import List, Mapping, Sequence
+import numpy as np
+import pandas as pd
 from pear_schedule.scheduler.baseScheduler import BaseScheduler
 from pear_schedule.db_utils.views import MedicationView
 
+logger = logging.getLogger(__name__)
+
+# Instructions that are left off the annotation
+EMPTY_INSTRUCTIONS = ("Nil", "nil", "-")
+
+MEDICATION_COLUMNS = ["PatientID", "day", "slot", "AdministerTime", "time", "annotation"]
+
+
 class medicationScheduler(BaseScheduler):
     @classmethod
     def fillSchedule(cls, patientSchedules: Mapping[str, List[str]]):
         medicationDF = MedicationView.get_data()
-        
-        for index, row, in medicationDF.iterrows():
-            
-            # ======== Variables ========
-            start_day_counter = 0
-            end_day_counter = cls.config["DAYS"] - 1
-            administerTime = row['AdministerTime']
-            pid = row["PatientID"]
-            startDateTime = row["StartDateTime"]
-            endDateTime = row['EndDateTime']
-            instruction = row['Instruction']
-            # print(f"PatientID: {pid} | Medication: {row['PrescriptionName']}")
-            
-            # ======== Check what is the start and end date of the medication in the given week ========
-            today = datetime.datetime.now()
-            start_of_week = today - datetime.timedelta(days=today.weekday(), hours=0, minutes=0, seconds=0, microseconds=0)  # Monday -> 00:00:00
-            start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_week = start_of_week + datetime.timedelta(days=4, hours=23, minutes=59, seconds=59, microseconds=0)  # Sunday -> 23:59:59
-            
-            if startDateTime <= start_of_week: # Medication starts either before or start of this week
-                pass
-            elif startDateTime > start_of_week and startDateTime <= end_of_week: # Medication starts sometime this week
-                start_day_counter = (start_of_week - startDateTime).days * -1
-            else: # Medication does not start this week
-                continue
-            # print(f"Medication starts on {start_day_counter}")
-            
-            if endDateTime <= end_of_week: # Medication will end sometime during the week
-                end_day_counter = (cls.config["DAYS"]-1) - (end_of_week - endDateTime).days
-            # print(f"Medication ends on {end_day_counter}")
-            
-            
-            # ======== Inserting medication into the scheduler ========
-            slots = administerTime.split(",")
-            
-            for slot in slots:
-                hour = getTimeSlot(int(slot))
-                if hour == -1: # Invalid time-slot
-                    continue
-                
-                for day in range(start_day_counter, end_day_counter+1):
-                    
-                    if "Give Medication" not in patientSchedules[pid][day][hour]:
-                        if instruction is None or instruction.strip() == "" or instruction in ["Nil", "nil" "-"]: 
-                            patientSchedules[pid][day][hour] += f" | Give Medication@{slot}: {row['PrescriptionName']}({row['Dosage']})"
-                        else:
-                            patientSchedules[pid][day][hour] += f" | Give Medication@{slot}: {row['PrescriptionName']}({row['Dosage']})**{instruction}"
-                    else:
-                        if instruction is None or instruction.strip() == "" or instruction in ["Nil", "nil" "-"]:
-                            patientSchedules[pid][day][hour] += f", Give Medication@{slot}: {row['PrescriptionName']}({row['Dosage']})"
-                        else:
-                            patientSchedules[pid][day][hour] += f", Give Medication@{slot}: {row['PrescriptionName']}({row['Dosage']})**{instruction}"
-
-def getTimeSlot(time):
-    if (900 <= time < 1000):
-        return 0
-    elif (1000 <= time < 1100):
-        return 1
-    elif (1100 <= time < 1200):
-        return 2
-    elif (1200 <= time < 1300):
-        return 3
-    elif (1300 <= time < 1400):
-        return 4
-    elif (1400 <= time < 1500):
-        return 5
-    elif (1500 <= time < 1600):
-        return 6
-    elif (1600 <= time < 1700):
-        return 7
-    else:
-        print("Invalid time-slot")
-        return -1
\ No newline at end of file
+
+        today = datetime.datetime.now()
+        start_of_week = today - datetime.timedelta(days=today.weekday())  # Monday -> 00:00:00
+        start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
+        days = [start_of_week + datetime.timedelta(days=day) for day in range(cls.config["DAYS"])]
+
+        doses = expandMedications(medicationDF, days)
+
+        invalid = doses["slot"] < 0
+        if invalid.any():
+            invalidTimes = doses.loc[invalid, "AdministerTime"].unique().tolist()
+            logger.warning(f"Skipping {invalid.sum()} medication doses with invalid time-slots {invalidTimes}")
+
+        annotations = doses[~invalid].groupby(["PatientID", "day", "slot"], sort=False)["annotation"].agg(", ".join)
+        for (pid, day, hour), annotation in annotations.items():
+            if "Give Medication" not in patientSchedules[pid][day][hour]:
+                patientSchedules[pid][day][hour] += f" | {annotation}"
+            else:
+                patientSchedules[pid][day][hour] += f", {annotation}"
+
+
+def expandMedications(medicationDF: pd.DataFrame, days: Sequence[datetime.datetime]) -> pd.DataFrame:
+    # One row per dose, ie. medication x AdministerTime x day, with the day index into days, the hour slot
+    # of the schedule (-1 if the time is outside 0900-1659) and the "Give Medication@..." annotation.
+    # A medication is given on days[d] if StartDateTime <= days[d] <= EndDateTime, a missing EndDateTime
+    # never ends. Rows are sorted by patient, day, time and then medication order, so the scheduler and the
+    # medication tester read the same doses in the same order.
+    if medicationDF.empty or len(days) == 0:
+        return pd.DataFrame(columns=MEDICATION_COLUMNS)
+
+    meds = medicationDF.reset_index(drop=True)
+    dayTimes = pd.DatetimeIndex(days).to_numpy()
+    starts = pd.to_datetime(meds["StartDateTime"]).to_numpy()[:, None]
+    ends = pd.to_datetime(meds["EndDateTime"]).to_numpy()[:, None]
+    active = (starts <= dayTimes) & ((ends >= dayTimes) | np.isnat(ends))
+
+    instruction = meds["Instruction"].fillna("").astype(str)
+    noInstruction = (instruction.str.strip() == "") | instruction.isin(EMPTY_INSTRUCTIONS)
+    labels = (meds["PrescriptionName"].astype(str) + "(" + meds["Dosage"].astype(str) + ")" +
+              ("**" + instruction).where(~noInstruction, "")).to_numpy()
+
+    # one entry per AdministerTime of each medication, in medication order
+    administerTimes = meds["AdministerTime"].str.split(",").explode()
+    doseMeds = administerTimes.index.to_numpy()
+    doseTimes = administerTimes.to_numpy(dtype=str)
+    times = doseTimes.astype(int)
+    annotations = np.array([f"Give Medication@{t}: {labels[m]}" for t, m in zip(doseTimes, doseMeds)], dtype=object)
+
+    dose, day = np.nonzero(active[doseMeds])
+    patients = meds["PatientID"].to_numpy()[doseMeds]
+    order = np.lexsort((dose, times[dose], day, patients[dose]))
+    dose, day = dose[order], day[order]
+
+    return pd.DataFrame({
+        "PatientID": patients[dose],
+        "day": day,
+        "slot": np.where((times[dose] >= 900) & (times[dose] < 1700), times[dose] // 100 - 9, -1),
+        "AdministerTime": doseTimes[dose],
+        "time": times[dose],
+        "annotation": annotations[dose],
+    }, columns=MEDICATION_COLUMNS)
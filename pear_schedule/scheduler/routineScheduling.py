@@ -1,6 +1,7 @@
 
 from typing import List, Mapping
 from pear_schedule.scheduler.baseScheduler import BaseScheduler
+from pear_schedule.db_utils.utils import parse_fixed_time_slots
 from pear_schedule.db_utils.views import PatientsOnlyView, ValidRoutineActivitiesView
 
 
@@ -23,11 +24,4 @@ class RoutineActivityScheduler(BaseScheduler):
 
     @classmethod
     def getFixedTimeArr(cls, fixedTimeSlots):
-        arr = []
-        fixedTimeArr = fixedTimeSlots.split(",")
-        for str in fixedTimeArr:
-            temp = str.split("-")
-            arr.append((int(temp[0]), int(temp[1])))
-        
-
-        return arr
\ No newline at end of file
+        return parse_fixed_time_slots(fixedTimeSlots)
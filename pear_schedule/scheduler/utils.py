@@ -25,7 +25,11 @@ def build_schedules(config, patientSchedules: Dict) -> Dict:
     RecommendedRoutineActivityScheduler.fillSchedule(patientSchedules)
 
     # Schedule group activities
-    groupSchedule = GroupActivityScheduler.fillSchedule(patientSchedules)
+    groupSchedule, isGroupScheduleOptimal, groupSearchTimedOut = GroupActivityScheduler.fillSchedule(patientSchedules)
+    if groupSearchTimedOut:
+        logger.warning("Group search ran out of time, using best group schedule found so far")
+    elif not isGroupScheduleOptimal:
+        logger.info("Group schedule is not proven optimal, a heuristic engine scheduled part of it")
     for patientID, scheduleArr in groupSchedule.items():
         for i, activity in enumerate(scheduleArr):
             if activity == "-": # routine activity alr scheduled
@@ -63,16 +67,6 @@ def build_schedules(config, patientSchedules: Dict) -> Dict:
     return patientSchedules
 
 
-def parseFixedTimeArr(fixedTimeSlots: str) -> List[Tuple[int, int]]:
-    arr = []
-    fixedTimeArr = fixedTimeSlots.split(",")
-    for str in fixedTimeArr:
-        temp = str.split("-")
-        arr.append((int(temp[0]), int(temp[1])))
-
-    return arr
-
-
 def checkActivityExcluded(
         activityID: int, 
         patientExclusions: Dict[int, datetime.datetime], 
@@ -91,11 +85,70 @@ def checkActivityExcluded(
         return exclusion_end is None or exclusion_end >= slot_datetime
 
 
-def rescheduleActivity(patient_schedule: List, day: int, time: int, potential_slots: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+WEEK_DAYS = 7
+
+
+def exclusionDayMasks(
+        patientExclusions: Dict[int, datetime.datetime],
+        week_start: datetime.datetime
+    ) -> Dict[int, int]:
+        # activityID: bitmask of the days of the week (bit d for week_start + d days) the activity is
+        # excluded on, same rule as checkActivityExcluded so checking a day is a single bit test
+        masks = {}
+        for activityID, exclusion_end in patientExclusions.items():
+            mask = 0
+            for day in range(WEEK_DAYS):
+                if exclusion_end is None or exclusion_end >= week_start + datetime.timedelta(days=day):
+                    mask |= 1 << day
+            if mask:
+                masks[activityID] = mask
+
+        return masks
+
+
+def checkDayExcluded(excludedDays: Dict[int, int], activityID: int, day_slot: int) -> bool:
+    return bool(excludedDays.get(activityID, 0) >> day_slot & 1)
+
+
+class FreeSlotIndex:
+    # Bitmask of the empty slots of each day of a patient's schedule (bit s for slot s), kept in step by
+    # the schedulers as they assign slots so free slot and gap lookups are bit operations instead of
+    # scans of the schedule
+    __slots__ = ("free",)
+
+    def __init__(self, patient_schedule: List[List[str]]):
+        self.free = [sum(1 << slot for slot, activity in enumerate(day) if not activity) for day in patient_schedule]
+
+    def isFree(self, day: int, slot: int) -> bool:
+        return bool(self.free[day] >> slot & 1)
+
+    def assign(self, day: int, slot: int):
+        self.free[day] &= ~(1 << slot)
+
+    def freeSlots(self, day: int) -> List[int]:
+        slots = []
+        mask = self.free[day]
+        while mask:
+            lowest = mask & -mask
+            slots.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return slots
+
+    def nextGap(self, day: int, start: int = 0) -> Optional[Tuple[int, int]]:
+        # (first slot, length) of the earliest run of empty slots from start, None if there is none
+        mask = self.free[day] >> start
+        if not mask:
+            return None
+
+        offset = (mask & -mask).bit_length() - 1
+        run = mask >> offset
+        length = ((run + 1) & ~run).bit_length() - 1  # trailing ones of run
+        return start + offset, length
+
+
+def rescheduleActivity(free_slots: FreeSlotIndex, potential_slots: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
     for slot in potential_slots:
-        slot_day, slot_time = slot
-        if patient_schedule[slot_day][slot_time]:
-            continue
-        return slot
+        if free_slots.isFree(*slot):
+            return slot
 
-    return None
\ No newline at end of file
+    return None
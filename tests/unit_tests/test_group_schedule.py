@@ -0,0 +1,551 @@
+from copy import deepcopy
+import os
+import random
+import time
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from pear_schedule.scheduler.groupCache import ResultCache, canonicalHash, decodeResult, encodeResult
+from pear_schedule.scheduler.groupLocalSearch import simulatedAnnealing
+from pear_schedule.scheduler.groupScheduling import GroupActivityScheduler, getEligibilityMatrices, getGroupSlotsFromSchedules
+from pear_schedule.scheduler.groupSearch import TranspositionTable, branchAndBound, buildTimeTable, compileGroupSearchProblem, constrainedActivityOrder, estimateSearchSpace, independentComponents, parallelBranchAndBound, repairAssignment, subProblem
+from pear_schedule.scheduler.groupSolvers import BranchAndBoundSolver, GroupSolver, buildAssignmentModel, getGroupSolver
+
+GROUP_TIMESLOT_MAPPING = [(0,1), (0,6), (1,1), (1,6), (2,1), (2,6), (3,1), (3,6), (4,1), (4,6)]
+
+
+def make_group_instance(seed, patients=8, activities=7, timeslots=4, routineRatio=0.15, maxActivitySize=None):
+    rng = random.Random(seed)
+    patientIDs = list(range(1, patients + 1))
+
+    activityMap = {}
+    records = []
+    for a in range(activities):
+        title = f"Activity {a}"
+        activityMap[title] = set(rng.sample(patientIDs, rng.randint(1, maxActivitySize or patients // 2)))
+
+        isFixed = rng.random() < 0.3
+        fixedTimeSlots = ",".join(f"{d}-{h}" for d, h in rng.sample(GROUP_TIMESLOT_MAPPING[:timeslots], 2))
+        records.append({
+            "ActivityID": a,
+            "ActivityTitle": title,
+            "IsFixed": isFixed,
+            "FixedTimeSlots": fixedTimeSlots if isFixed else None,
+            "MinPeopleReq": 1,
+        })
+
+    timeTable = {pid: ["-" if rng.random() < routineRatio else "" for _ in range(timeslots)] for pid in patientIDs}
+
+    return activityMap, timeTable, pd.DataFrame(records)
+
+
+def assert_feasible(activityMap, timeTable, resultTimeTable, filledSlots):
+    # existing entries are kept, every activity sits in at most one timeslot with only its own patients
+    activitySlots = {}
+    for pid, slots in resultTimeTable.items():
+        for ts, activity in enumerate(slots):
+            if timeTable[pid][ts] != "":
+                assert activity == timeTable[pid][ts]
+            elif activity:
+                assert pid in activityMap[activity]
+                assert activitySlots.setdefault(activity, ts) == ts
+
+    assert sum(len(activityMap[activity]) for activity in activitySlots) == filledSlots
+
+
+class TestGroupSearchEngines:
+    @pytest.fixture(autouse=True)
+    def mock_config(self):
+        config = {"GROUP_TIMESLOT_MAPPING": GROUP_TIMESLOT_MAPPING}
+        with (
+            patch.object(GroupActivityScheduler, "config", config, create=True),
+            patch.object(GroupSolver, "config", config, create=True),
+        ):
+            yield
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_branch_and_bound_matches_brute_force(self, seed):
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed)
+        timeslots = 4
+        emptySlots = len(timeTable) * timeslots
+
+        expectedTimeTable, expectedEmptySlots, expectedIsOptimal, _ = GroupActivityScheduler.bruteForceGroupScheduling(
+            activityMap, timeTable, timeslots, emptySlots, groupActivityDF
+        )
+        resultTimeTable, resultEmptySlots, resultIsOptimal, resultTimedOut = GroupActivityScheduler.solverGroupScheduling(
+            BranchAndBoundSolver, activityMap, timeTable, timeslots, emptySlots, groupActivityDF
+        )
+
+        assert resultEmptySlots == expectedEmptySlots
+        assert resultTimeTable == expectedTimeTable
+        assert resultIsOptimal and expectedIsOptimal
+        assert not resultTimedOut
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_symmetry_breaking_matches_brute_force(self, seed):
+        # no routine blocks so many timeslots are interchangeable
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed, routineRatio=0)
+
+        expected = GroupActivityScheduler.bruteForceGroupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+        with patch.dict(GroupActivityScheduler.config, {"GROUP_SEARCH_SYMMETRY_BREAKING": True}):
+            result = GroupActivityScheduler.solverGroupScheduling(BranchAndBoundSolver, activityMap, timeTable, 4, 32, groupActivityDF)
+
+        assert result == expected
+
+    @pytest.mark.parametrize("engine", ["bruteForce", "branchAndBound"])
+    def test_search_stops_at_deadline(self, engine):
+        activityMap, timeTable, groupActivityDF = make_group_instance(0)
+        originalTimeTable = deepcopy(timeTable)
+
+        with (
+            patch.dict(GroupActivityScheduler.config, {"GROUP_SCHEDULING_ENGINE": engine}),
+            patch("pear_schedule.scheduler.groupSearch.DEADLINE_CHECK_INTERVAL", 1),
+        ):
+            resultTimeTable, resultEmptySlots, resultIsOptimal, resultTimedOut = GroupActivityScheduler.groupScheduling(
+                activityMap, timeTable, 4, 32, groupActivityDF, deadline=time.monotonic() - 1
+            )
+
+        assert not resultIsOptimal
+        assert resultTimedOut
+        assert resultEmptySlots == 32, "only the root incumbent should have been recorded"
+        assert resultTimeTable == originalTimeTable
+        assert timeTable == originalTimeTable, "partial assignment should be undone on timeout"
+
+    def test_brute_force_stays_within_budget(self):
+        # a round far too large to finish, every node checks the clock so it stops right after the deadline
+        activityMap, timeTable, groupActivityDF = make_group_instance(1, patients=30, activities=14, timeslots=10)
+
+        with patch.dict(GroupActivityScheduler.config, {"GROUP_SCHEDULING_ENGINE": "bruteForce"}):
+            start = time.monotonic()
+            _, _, resultIsOptimal, resultTimedOut = GroupActivityScheduler.groupScheduling(
+                activityMap, timeTable, 10, 300, groupActivityDF, deadline=start + 0.05
+            )
+
+        assert not resultIsOptimal
+        assert resultTimedOut
+        assert time.monotonic() - start < 0.5
+
+    def test_engine_selected_by_config(self):
+        activityMap, timeTable, groupActivityDF = make_group_instance(0)
+
+        with patch.dict(GroupActivityScheduler.config, {"GROUP_SCHEDULING_ENGINE": "bruteForce"}):
+            with patch.object(GroupActivityScheduler, "bruteForceGroupScheduling", return_value=({}, 0, True, False)) as bruteForce:
+                GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+        bruteForce.assert_called_once()
+
+        with patch.dict(GroupActivityScheduler.config, {"GROUP_SCHEDULING_ENGINE": "unknown"}):
+            with pytest.raises(ValueError):
+                GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+
+
+    def test_constrained_order_solver_returns_assignment_in_problem_order(self):
+        activityMap, timeTable, groupActivityDF = make_group_instance(3)
+
+        with patch.dict(GroupSolver.config, {"GROUP_SEARCH_ACTIVITY_ORDER": "constrained"}):
+            resultTimeTable, resultEmptySlots, _, _ = GroupActivityScheduler.solverGroupScheduling(
+                BranchAndBoundSolver, activityMap, timeTable, 4, 32, groupActivityDF
+            )
+
+        assert_feasible(activityMap, timeTable, resultTimeTable, 32 - resultEmptySlots)
+
+    @pytest.mark.parametrize("engine", ["cpSat", "pulp"])
+    @pytest.mark.parametrize("seed", range(5))
+    def test_exact_solver_at_least_as_good_as_search(self, engine, seed):
+        # the MIP / CP model may leave out activities that the search tree would have to place, so its
+        # optimum can only be equal or better
+        pytest.importorskip({"cpSat": "ortools", "pulp": "pulp"}[engine])
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed)
+
+        _, expectedEmptySlots, _, _ = GroupActivityScheduler.bruteForceGroupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+        with patch.dict(GroupSolver.config, {"GROUP_SCHEDULING_ENGINE": engine}):
+            resultTimeTable, resultEmptySlots, resultIsOptimal, resultTimedOut = GroupActivityScheduler.groupScheduling(
+                activityMap, timeTable, 4, 32, groupActivityDF
+            )
+
+        assert resultIsOptimal
+        assert not resultTimedOut
+        assert resultEmptySlots <= expectedEmptySlots
+        assert_feasible(activityMap, timeTable, resultTimeTable, 32 - resultEmptySlots)
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_decomposition_matches_brute_force(self, seed):
+        # small activities over many patients split into several components
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed, patients=40, activities=7, maxActivitySize=3)
+        possibleTimeSlots = GroupActivityScheduler.getPossibleTimeSlots(list(activityMap.keys()), 4, groupActivityDF)
+        assert len(independentComponents(compileGroupSearchProblem(activityMap, timeTable, 4, possibleTimeSlots))) > 1
+
+        expected = GroupActivityScheduler.bruteForceGroupScheduling(activityMap, timeTable, 4, 160, groupActivityDF)
+        with patch.dict(GroupSolver.config, {"GROUP_SEARCH_DECOMPOSE": True}):
+            result = GroupActivityScheduler.solverGroupScheduling(BranchAndBoundSolver, activityMap, timeTable, 4, 160, groupActivityDF)
+
+        assert result == expected
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_dsatur_feasible(self, seed):
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed)
+
+        with patch.dict(GroupSolver.config, {"GROUP_SCHEDULING_ENGINE": "dsatur"}):
+            resultTimeTable, resultEmptySlots, _, _ = GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+
+        assert_feasible(activityMap, timeTable, resultTimeTable, 32 - resultEmptySlots)
+        assert resultEmptySlots < 32
+
+    def test_heuristic_selected_over_search_space_limit(self):
+        activityMap, timeTable, groupActivityDF = make_group_instance(0, routineRatio=0)
+        possibleTimeSlots = GroupActivityScheduler.getPossibleTimeSlots(list(activityMap.keys()), 4, groupActivityDF)
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, possibleTimeSlots)
+        searchSpace = estimateSearchSpace(problem)
+
+        with patch.dict(GroupSolver.config, {"GROUP_SEARCH_SPACE_LIMIT_LOG10": searchSpace}):
+            assert GroupActivityScheduler.selectGroupSolver(BranchAndBoundSolver, problem) is BranchAndBoundSolver
+        with patch.dict(GroupSolver.config, {"GROUP_SEARCH_SPACE_LIMIT_LOG10": searchSpace - 1}):
+            assert GroupActivityScheduler.selectGroupSolver(BranchAndBoundSolver, problem) is getGroupSolver("dsatur")
+
+    def test_solver_registry(self):
+        assert getGroupSolver("branchAndBound") is BranchAndBoundSolver
+        with pytest.raises(ValueError):
+            getGroupSolver("unknown")
+
+    def test_assignment_model(self):
+        timeTable = {10: ["", "-", ""], 20: ["", "", ""], 30: ["", "", ""]}
+        activityMap = {"Karaoke": {10, 30}, "Taichi": {10, 20}, "Bingo": {20}}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 3, [[0, 1, 2], [0, 1], [0, 1, 2]])
+
+        variables, clashes = buildAssignmentModel(problem)
+
+        # Karaoke and Taichi cannot use timeslot 1, patient 10 has a routine there
+        assert variables == [(0, 0), (0, 2), (1, 0), (2, 0), (2, 1), (2, 2)]
+        assert sorted(clashes) == [[0, 2], [2, 3]]
+
+
+class TestGroupSearchProblem:
+    def test_compile_group_search_problem(self):
+        timeTable = {10: ["", "-", ""], 20: ["-", "", ""], 30: ["", "", "Bingo"]}
+        activityMap = {"Karaoke": {10, 30}, "Taichi": {20}}
+
+        problem = compileGroupSearchProblem(activityMap, timeTable, 3, [[0, 1, 2], [2]])
+
+        assert problem.patientIDs == [10, 20, 30]
+        assert problem.initialBusy == [0b010, 0b001, 0b100]
+        assert problem.activityMasks == [0b101, 0b010]
+        assert problem.activitySizes == [2, 1]
+
+    def test_independent_components(self):
+        timeTable = {10: ["", ""], 20: ["", ""], 30: ["", ""], 40: ["", ""]}
+        activityMap = {"Karaoke": {10}, "Taichi": {30, 40}, "Bingo": {20}, "Yoga": {10, 20}, "Art": set()}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 2, [[0, 1]] * 5)
+
+        components = independentComponents(problem)
+
+        assert components == [[0, 2, 3], [1], [4]]
+        assert subProblem(problem, components[0]).activityList == ["Karaoke", "Bingo", "Yoga"]
+
+    def test_build_time_table(self):
+        timeTable = {10: ["", "-", ""], 20: ["-", "", ""], 30: ["", "", "Bingo"]}
+        activityMap = {"Karaoke": {10, 30}, "Taichi": {20}}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 3, [[0, 1, 2], [2]])
+
+        result = buildTimeTable(problem, timeTable, [0, -1])
+
+        assert result == {10: ["Karaoke", "-", ""], 20: ["-", "", ""], 30: ["Karaoke", "", "Bingo"]}
+        assert timeTable[10] == ["", "-", ""], "input timetable should not be modified"
+
+
+class TestParallelGroupSearch:
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("splitDepth", [1, 2, 10])
+    def test_parallel_matches_serial(self, seed, splitDepth):
+        activityMap, timeTable, groupActivityDF = make_group_instance(seed, patients=10, activities=8)
+        possibleTimeSlots = [[0, 1, 2, 3] if i % 3 else [1, 3] for i in range(len(activityMap))]
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, possibleTimeSlots)
+
+        expected = branchAndBound(problem, 40)
+        result = parallelBranchAndBound(problem, 40, workers=2, splitDepth=splitDepth, tableSize=1000)
+
+        assert result.emptySlots == expected.emptySlots
+        assert result.assignment == expected.assignment
+        assert result.isOptimal
+
+
+class TestSearchOrdering:
+    def test_symmetry_breaking_saves_nodes(self):
+        activityMap, timeTable, _ = make_group_instance(0, patients=12, activities=9, routineRatio=0)
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, [[0, 1, 2, 3]] * len(activityMap))
+
+        withSymmetry = branchAndBound(problem, 48, symmetryBreaking=True)
+        withoutSymmetry = branchAndBound(problem, 48, symmetryBreaking=False)
+
+        assert withSymmetry.assignment == withoutSymmetry.assignment
+        assert withSymmetry.nodes < withoutSymmetry.nodes
+
+    @pytest.mark.parametrize("seed", range(10))
+    @pytest.mark.parametrize("tableSize", [3, 1000])
+    def test_transposition_table_matches_search(self, seed, tableSize):
+        activityMap, timeTable, _ = make_group_instance(seed, patients=10, activities=9, routineRatio=0)
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, [[0, 1, 2, 3] if i % 3 else [1, 3] for i in range(9)])
+
+        expected = branchAndBound(problem, 40)
+        result = branchAndBound(problem, 40, tableSize=tableSize)
+
+        assert result.assignment == expected.assignment
+        assert result.emptySlots == expected.emptySlots
+        assert result.nodes <= expected.nodes
+        assert result.tableHits <= result.tableLookups
+
+    def test_transposition_table_eviction(self):
+        table = TranspositionTable(2)
+        table.store("a", 3)
+        table.store("b", 2)
+        assert table.get("a") == 3  # "b" becomes least recently used
+        table.store("c", 1)
+        table.store("a", 5)  # keeps the tighter bound
+
+        assert table.get("b") is None
+        assert table.get("a") == 3
+        assert table.evictions == 1
+        assert table.lookups == 3
+
+    def test_constrained_activity_order(self):
+        timeTable = {1: ["", "-", ""], 2: ["", "", ""], 3: ["", "", ""]}
+        activityMap = {"Small": {1}, "Large": {1, 2, 3}, "Fixed": {2}}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 3, [[0, 1, 2], [0, 1, 2], [1]])
+
+        ordered = constrainedActivityOrder(problem)
+
+        assert ordered.activityList == ["Fixed", "Large", "Small"]
+        assert ordered.possibleTimeSlots == [[1], [0, 1, 2], [0, 1, 2]]
+        assert buildTimeTable(ordered, timeTable, [1, 0, 2]) == buildTimeTable(problem, timeTable, [2, 0, 1])
+
+
+class TestEligibilityMatrices:
+    def test_get_eligibility_matrices(self):
+        preferenceDF = pd.DataFrame({"CentreActivityID": [1, 2, 2, 9], "PatientID": [10, 10, 20, 10], "IsLike": [1, 0, 1, 1]})
+        recommendationDF = pd.DataFrame({"CentreActivityID": [1, 2], "PatientID": [20, 30], "DoctorRecommendation": [True, False]})
+        excludedDF = pd.DataFrame({"CentreActivityID": [1, 1], "PatientID": [30, 99]})
+
+        eligibility = getEligibilityMatrices([10, 20, 30], [1, 2], preferenceDF, recommendationDF, excludedDF)
+
+        # rows of unknown patients / activities are dropped
+        assert eligibility.liked.tolist() == [[True, False], [False, True], [False, False]]
+        assert eligibility.recommended.tolist() == [[False, False], [True, False], [False, False]]
+        assert eligibility.notRecommended.tolist() == [[False, False], [False, False], [False, True]]
+        assert eligibility.excluded.tolist() == [[False, False], [False, False], [True, False]]
+
+
+class TestFillToTarget:
+    @pytest.fixture(autouse=True)
+    def mock_config(self):
+        with patch.object(GroupActivityScheduler, "config", {"TARGET_WEEKLY_GROUP_ACTIVITIES": 2}, create=True):
+            yield
+
+    def test_fill_to_target(self):
+        timeTable = {
+            1: ["Karaoke", "", "", "-"],
+            2: ["", "Bingo", "", "Taichi"],
+            3: ["", "", "", ""],
+            4: ["Karaoke", "Bingo", "", ""],
+        }
+        activityExclusionMap = {"Karaoke": {3}, "Bingo": set(), "Taichi": set()}
+        reversedTimeTable = deepcopy(timeTable)
+
+        GroupActivityScheduler.fillToTarget(timeTable, [1, 2, 3, 4], activityExclusionMap)
+        GroupActivityScheduler.fillToTarget(reversedTimeTable, [4, 3, 2, 1], activityExclusionMap)
+
+        # patient 2 is already at the target, patient 3 is excluded from Karaoke
+        assert timeTable == {
+            1: ["Karaoke", "Bingo", "", "-"],
+            2: ["", "Bingo", "", "Taichi"],
+            3: ["", "Bingo", "", "Taichi"],
+            4: ["Karaoke", "Bingo", "", ""],
+        }
+        # no capacity limit, so patients do not compete and their order does not matter
+        assert reversedTimeTable == timeTable
+
+
+class TestLocalSearch:
+    def test_simulated_annealing_improves_greedy_assignment(self):
+        # Karaoke in timeslot 0 blocks both Taichi and Bingo, which only fit there
+        timeTable = {1: ["", "-"], 2: ["", ""], 3: ["", "-"]}
+        activityMap = {"Karaoke": {2}, "Taichi": {1, 2}, "Bingo": {2, 3}}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 2, [[0, 1], [0], [0, 1]])
+
+        result = simulatedAnnealing(problem, [0, -1, -1], 5, iterations=200, seed=0)
+
+        assert result.emptySlots == 3
+        assert result.assignment == [1, 0, -1]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_simulated_annealing_feasible_and_reproducible(self, seed):
+        activityMap, timeTable, _ = make_group_instance(seed, patients=12, activities=9)
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, [[0, 1, 2, 3] if i % 3 else [1, 3] for i in range(9)])
+        initial = [-1] * 9
+
+        result = simulatedAnnealing(problem, initial, 48, iterations=2000, seed=seed)
+
+        assert result.emptySlots <= 48
+        assert result.assignment == simulatedAnnealing(problem, initial, 48, iterations=2000, seed=seed).assignment
+        assert_feasible(activityMap, timeTable, buildTimeTable(problem, timeTable, result.assignment), 48 - result.emptySlots)
+
+
+class TestWarmStart:
+    def test_repair_assignment(self):
+        timeTable = {1: ["", "-", ""], 2: ["", "", ""], 3: ["", "", ""]}
+        activityMap = {"Karaoke": {1, 2}, "Taichi": {2, 3}, "Bingo": {3}, "Art": {1}}
+        problem = compileGroupSearchProblem(activityMap, timeTable, 3, [[0, 1, 2], [0, 1, 2], [0, 1, 2], [2]])
+
+        # Karaoke's old timeslot is blocked by patient 1's routine, Taichi keeps its old timeslot
+        assignment = repairAssignment(problem, {"Karaoke": 1, "Taichi": 0, "Unknown": 2})
+
+        assert assignment == [2, 0, 1, -1]
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_warm_start_never_worse(self, seed):
+        activityMap, timeTable, _ = make_group_instance(seed, patients=10, activities=8)
+        problem = compileGroupSearchProblem(activityMap, timeTable, 4, [[0, 1, 2, 3] if i % 3 else [1, 3] for i in range(8)])
+        previousSlots = {activity: (i * 3) % 4 for i, activity in enumerate(problem.activityList)}
+        warmStart = repairAssignment(problem, previousSlots)
+
+        cold = branchAndBound(problem, 40)
+        warm = branchAndBound(problem, 40, incumbent=warmStart)
+        parallel = parallelBranchAndBound(problem, 40, workers=2, incumbent=warmStart)
+
+        assert warm.emptySlots == cold.emptySlots
+        assert parallel.emptySlots == cold.emptySlots and parallel.assignment == warm.assignment
+
+    def test_group_slots_from_schedules(self):
+        scheduleDF = pd.DataFrame({
+            "PatientID": [1, 2, 3],
+            "Monday": ["Lunch--Karaoke--Nap", "Lunch--Karaoke | Give Medication@1100: Panadol(1 tab)--Nap", "Lunch--Taichi--Nap"],
+            "Tuesday": ["Karaoke--Free and Easy", "", "Taichi--Taichi"],
+        })
+
+        previousSlots = getGroupSlotsFromSchedules(scheduleDF, {"Karaoke", "Taichi"}, [(0, 1), (1, 0), (1, 1)], ["Monday", "Tuesday"])
+
+        assert previousSlots == {"Karaoke": 0, "Taichi": 0}
+
+    def test_previous_group_slots_cache(self, tmp_path):
+        config = {"GROUP_WARM_START": "cache", "GROUP_WARM_START_CACHE_FILE": str(tmp_path / "slots.json")}
+        timeTable = {1: ["Karaoke", "-", ""], 2: ["Karaoke", "Taichi", ""]}
+
+        with patch.object(GroupActivityScheduler, "config", config, create=True):
+            assert GroupActivityScheduler.loadPreviousGroupSlots({"Karaoke", "Taichi"}) == {}
+            GroupActivityScheduler.saveGroupSlots(timeTable)
+            assert GroupActivityScheduler.loadPreviousGroupSlots({"Karaoke", "Taichi"}) == {"Karaoke": 0, "Taichi": 1}
+        assert os.listdir(tmp_path) == ["slots.json"]  # written through a temporary file that replaces it
+
+    def test_previous_group_slots_cache_needs_absolute_path(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        config = {"GROUP_WARM_START": "cache", "GROUP_WARM_START_CACHE_FILE": "slots.json"}
+
+        with patch.object(GroupActivityScheduler, "config", config, create=True):
+            GroupActivityScheduler.saveGroupSlots({1: ["Karaoke", "-", ""]})
+            assert GroupActivityScheduler.loadPreviousGroupSlots({"Karaoke"}) == {}
+
+        assert os.listdir(tmp_path) == []
+
+
+class TestResultCache:
+    def test_hit_and_miss(self, tmp_path):
+        cache = ResultCache(str(tmp_path), 2**20)
+        key = canonicalHash({"Karaoke": [1, 2]}, [[1, ["", "-"]]])
+
+        assert cache.get(key) is None
+        cache.put(key, encodeResult(({1: ["Karaoke", "-"]}, 0, True)))
+
+        assert decodeResult(cache.get(key)) == ({1: ["Karaoke", "-"]}, 0, True)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert key == canonicalHash({"Karaoke": [1, 2]}, [[1, ["", "-"]]])
+        assert key != canonicalHash({"Karaoke": [1, 2]}, [[1, ["", ""]]])
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResultCache(str(tmp_path), 2**20)
+        for key in ["a", "b", "c"]:
+            cache.put(key, "x" * 1000)
+        entrySize = (tmp_path / "a.json").stat().st_size
+
+        # touch "a" so "b" is the least recently used when the cap only fits two entries
+        for i, key in enumerate(["b", "c", "a"]):
+            cache.get(key)
+            os.utime(cache.path(key), (i, i))
+        cache.maxBytes = 2 * entrySize
+        cache.put("c", "x" * 1000)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "c.json"]
+        assert cache.evictions == 1
+
+    def test_unreadable_entry_is_a_miss(self, tmp_path):
+        cache = ResultCache(str(tmp_path), 2**20)
+        (tmp_path / "a.json").write_bytes(b"\x80\x04not json")
+
+        assert cache.get("a") is None
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize("timeBudget, refinements", [(None, 1), (5, 2)])
+    def test_group_phase_not_cached_after_time_limited_annealing(self, tmp_path, timeBudget, refinements):
+        config = {
+            "GROUP_TIMESLOTS": 2,
+            "GROUP_TIMESLOT_MAPPING": [(0, 0), (0, 1)],
+            "GROUP_SCHEDULING_ENGINE": "bruteForce",
+            "TARGET_WEEKLY_GROUP_ACTIVITIES": 2,
+            "GROUP_RESULT_CACHE_DIR": str(tmp_path),
+            "GROUP_LOCAL_SEARCH_ITERATIONS": 10,
+            "GROUP_LOCAL_SEARCH_TIME_BUDGET_S": timeBudget,
+        }
+        views = "pear_schedule.scheduler.groupScheduling"
+        with patch.object(GroupActivityScheduler, "config", config, create=True), \
+            patch(f"{views}.PatientsOnlyView.get_data", return_value=pd.DataFrame({"PatientID": [1, 2, 3]})), \
+            patch(f"{views}.GroupActivitiesOnlyView.get_data", return_value=pd.DataFrame({
+                "ActivityID": [1, 2], "ActivityTitle": ["Karaoke", "Bingo"], "MinPeopleReq": [2, 2], "IsFixed": [False, False], "FixedTimeSlots": ["", ""],
+            })), \
+            patch(f"{views}.GroupActivitiesPreferenceView.get_data", return_value=pd.DataFrame({"CentreActivityID": [1, 1, 2], "PatientID": [1, 2, 3], "IsLike": [1, 1, 1]})), \
+            patch(f"{views}.GroupActivitiesRecommendationView.get_data", return_value=pd.DataFrame({"CentreActivityID": [], "PatientID": [], "DoctorRecommendation": []})), \
+            patch(f"{views}.GroupActivitiesExclusionView.get_data", return_value=pd.DataFrame({"CentreActivityID": [], "PatientID": []})), \
+            patch.object(GroupActivityScheduler, "refineGroupSchedule", wraps=GroupActivityScheduler.refineGroupSchedule) as refine:
+            GroupActivityScheduler.resultCache = None
+            schedules = {pid: [["", ""]] for pid in [1, 2, 3]}
+            first = GroupActivityScheduler.fillSchedule(deepcopy(schedules))
+            second = GroupActivityScheduler.fillSchedule(deepcopy(schedules))
+
+        # a phase refined under a wall clock budget is refined again instead of read back from the cache
+        assert first == second
+        assert refine.call_count == refinements
+
+    def test_heuristic_round_cached_although_not_proven_optimal(self, tmp_path):
+        activityMap, timeTable, groupActivityDF = make_group_instance(4)
+        config = {
+            "GROUP_TIMESLOT_MAPPING": GROUP_TIMESLOT_MAPPING,
+            "GROUP_SCHEDULING_ENGINE": "branchAndBound",
+            "GROUP_SEARCH_SPACE_LIMIT_LOG10": -1, # every component goes to the heuristic
+            "GROUP_RESULT_CACHE_DIR": str(tmp_path),
+        }
+
+        with patch.object(GroupActivityScheduler, "config", config, create=True):
+            expected = GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF, deadline=time.monotonic() + 60)
+            with patch.object(getGroupSolver("dsatur"), "solve") as solve:
+                assert GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF) == expected
+                solve.assert_not_called()
+
+        # dsatur is not proven optimal here but never times out, so its round is reproducible
+        assert not expected[2] and not expected[3]
+
+    def test_group_round_reused(self, tmp_path):
+        activityMap, timeTable, groupActivityDF = make_group_instance(0)
+        config = {
+            "GROUP_TIMESLOT_MAPPING": GROUP_TIMESLOT_MAPPING,
+            "GROUP_SCHEDULING_ENGINE": "bruteForce",
+            "GROUP_RESULT_CACHE_DIR": str(tmp_path),
+        }
+
+        with patch.object(GroupActivityScheduler, "config", config, create=True):
+            expected = GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF)
+            with patch.object(GroupActivityScheduler, "bruteForceGroupScheduling", return_value=({}, 0, True, False)) as bruteForce:
+                assert GroupActivityScheduler.groupScheduling(activityMap, timeTable, 4, 32, groupActivityDF) == expected
+                bruteForce.assert_not_called()
+
+                # a new routine block is a different input
+                blockedTimeTable = deepcopy(timeTable)
+                blockedTimeTable[1] = ["-"] * 4
+                GroupActivityScheduler.groupScheduling(activityMap, blockedTimeTable, 4, 32, groupActivityDF)
+                bruteForce.assert_called_once()
@@ -1,39 +1,57 @@
 import datetime
 from unittest.mock import patch
 import pandas as pd
-from pear_schedule.scheduler.individualScheduling import IndividualActivityScheduler, _get_max_enddate, calculate_activity_availabillity
+from pear_schedule.db_utils.utils import fixed_time_slot_indices, parse_fixed_time_slots
+from pear_schedule.scheduler.individualScheduling import ActivityCatalogue, IndividualActivityScheduler, PatientProfile, PreferredActivityScheduler, RecommendedRoutineActivityScheduler, _partition_by_patient, calculate_activity_availabillity, fixed_slot_suffix_counts
+from pear_schedule.scheduler.utils import FreeSlotIndex, checkActivityExcluded, checkDayExcluded, exclusionDayMasks
 from tests.utils import fake_fn
 
 class TestUtils:
     def test_get_patient_data(self):
         exclusion_end = datetime.datetime.now()
+        week_end = exclusion_end + datetime.timedelta(days=7)
 
         fake_patients_view = fake_fn(pd.DataFrame({
-            "PatientID": [1,1,2,4],
-            "PreferredActivityID": [1,2,1,4]
+            "PatientID": [1,1,2,4,5],
+            "PreferredActivityID": [1,2,1,4,None],
+            "ActivityEndDate": [week_end + datetime.timedelta(days=1)]*3 + [exclusion_end, None],
+        }))
+        fake_unpreferred_view = fake_fn(pd.DataFrame({
+            "PatientID": [4],
+            "DispreferredActivityID": [3],
+            "ActivityEndDate": [week_end],
         }))
         fake_exclusion_view = fake_fn(pd.DataFrame({
-            "ActivityExclusionID": [1,2,3],
-            "ActivityID": [4,1,2],
-            "PatientID": [3,2,1],
-            "ExclusionRemarks": ["",None,""],
-            "EndDateTime": [exclusion_end]*3,
-            "ActivityTitle": ["test1", "test2", "test3"],
+            "ActivityExclusionID": [1,2,3,4,5],
+            "ActivityID": [4,1,2,3,3],
+            "PatientID": [3,2,1,1,1],
+            "ExclusionRemarks": ["",None,"","",""],
+            "EndDateTime": [exclusion_end]*3 + [None, exclusion_end],
+            "ActivityTitle": ["test1", "test2", "test3", "test4", "test4"],
+        }))
+        fake_disrecommended_view = fake_fn(pd.DataFrame({
+            "ActivityID": [1],
+            "PatientID": [3],
         }))
         with (
             patch("pear_schedule.scheduler.individualScheduling.PatientsView.get_data", fake_patients_view),
+            patch("pear_schedule.scheduler.individualScheduling.PatientsUnpreferredView.get_data", fake_unpreferred_view),
             patch("pear_schedule.scheduler.individualScheduling.ActivitiesExcludedView.get_data", fake_exclusion_view),
+            patch("pear_schedule.scheduler.individualScheduling.DisrecommendedActivitiesView.get_data", fake_disrecommended_view),
         ):
-            result = IndividualActivityScheduler._get_patient_data()
+            result = IndividualActivityScheduler._get_patient_data(week_end=week_end)
 
+        # an exclusion without an end date outlasts any other for the same activity
         expected = {
-            1: {"preferences": {1: True, 2: True}, "exclusions": {2: exclusion_end}},
-            2: {"preferences": {1: True}, "exclusions": {1: exclusion_end}},
-            3: {"preferences": {}, "exclusions": {4: exclusion_end}},
-            4: {"preferences": {4: True}, "exclusions": {}},
+            1: {"preferences": {1, 2}, "exclusions": {2: exclusion_end, 3: None}},
+            2: {"preferences": {1}, "exclusions": {1: exclusion_end}},
+            4: {"preferences": set(), "exclusions": {}},
+            5: {"preferences": set(), "exclusions": {}},
+            3: {"preferences": set(), "exclusions": {4: exclusion_end, 1: week_end}},
         }
 
         assert result.keys() == expected.keys(), f"expected patients {expected.keys()} \ngot {result.keys()}"
+        assert result[4].dispreferences == {3}
 
         mismatched_patients = {
             "patientID": [],
@@ -45,28 +63,20 @@ class TestUtils:
 
         for p in expected:
             valid = True
-            if result[p]["preferences"] != expected[p]["preferences"]:
+            if result[p].preferences != expected[p]["preferences"]:
                 valid = False
-            elif result[p]["exclusions"] != expected[p]["exclusions"]:
+            elif result[p].exclusion_ends != expected[p]["exclusions"] or result[p].exclusions != expected[p]["exclusions"].keys():
                 valid = False
 
             if not valid:
                 mismatched_patients["patientID"].append(p)
                 mismatched_patients["expected_preferences"].append(expected[p]["preferences"])
-                mismatched_patients["result_preferences"].append(result[p]["preferences"])
+                mismatched_patients["result_preferences"].append(result[p].preferences)
                 mismatched_patients["expected_exclusions"].append(expected[p]["exclusions"])
-                mismatched_patients["result_exclusions"].append(result[p]["exclusions"])
+                mismatched_patients["result_exclusions"].append(result[p].exclusion_ends)
 
         assert not mismatched_patients["patientID"], f"{pd.DataFrame(mismatched_patients)}"
 
-    def test_get_max_enddate(self):
-        lo_dt = datetime.datetime.now()
-        hi_dt = lo_dt + datetime.timedelta(days=1)
-        assert _get_max_enddate(None, None) == None
-        assert _get_max_enddate(None, lo_dt) == None
-        assert _get_max_enddate(lo_dt, None) == None
-        assert _get_max_enddate(lo_dt, hi_dt) == hi_dt
-
     def test_calculate_activity_availabillity(self):
         assert calculate_activity_availabillity(0, 0, "") == 1000
         assert calculate_activity_availabillity(6, 10, "") == 1000
@@ -75,12 +85,105 @@ class TestUtils:
         assert calculate_activity_availabillity(1, 1, "0-2,1-1,1-5,4-3") == 3
         assert calculate_activity_availabillity(1, 2, "0-2,1-1,1-5,4-3") == 2
 
+    def test_exclusion_day_masks(self):
+        week_start = datetime.datetime(2024, 1, 1, 10, 30)
+        exclusions = {
+            1: None,
+            2: week_start + datetime.timedelta(days=2),
+            3: week_start + datetime.timedelta(days=2, hours=-1),
+            4: week_start - datetime.timedelta(days=1),
+        }
+
+        masks = exclusionDayMasks(exclusions, week_start)
+
+        assert masks == {1: 0b1111111, 2: 0b111, 3: 0b11}
+        for activityID in [1, 2, 3, 4, 5]:
+            for day in range(7):
+                assert checkDayExcluded(masks, activityID, day) == checkActivityExcluded(activityID, exclusions, day, week_start)
+
+    def test_parse_fixed_time_slots(self):
+        assert parse_fixed_time_slots("0-2,1-1,4-3") == ((0, 2), (1, 1), (4, 3))
+        assert parse_fixed_time_slots("0-2,1-1,4-3") is parse_fixed_time_slots("0-2,1-1,4-3")
+        assert fixed_time_slot_indices("1-6,0-1", [(0,1), (0,6), (1,1), (1,6)]) == (3, 0)
+
+    def test_free_slot_index(self):
+        free_slots = FreeSlotIndex([["a", "", "", "b", ""], ["", "", "", "", ""]])
+
+        assert free_slots.freeSlots(0) == [1, 2, 4]
+        assert free_slots.nextGap(0) == (1, 2)
+        assert free_slots.nextGap(0, 3) == (4, 1)
+        free_slots.assign(1, 0)
+        assert free_slots.nextGap(1) == (1, 4)
+        assert not free_slots.isFree(1, 0) and free_slots.isFree(1, 1)
+
 class TestFixedRecommendedScheduling:
-    pass
+    def test_suffix_counts(self):
+        for fixedTimeSlots in ["", "0-2,1-1,1-5,4-3", "4-7,0-0,0-0,5-1"]:
+            counts = fixed_slot_suffix_counts(fixedTimeSlots, 5, 8)
+            for day in range(5):
+                for slot in range(8):
+                    assert counts[day * 8 + slot] == calculate_activity_availabillity(day, slot, fixedTimeSlots)
+
+    def test_most_constrained_first(self):
+        schedule = [["", "", "Lunch"], ["", "", ""]]
+        activities = pd.DataFrame({
+            "ActivityID": [1, 2, 3, 4],
+            "ActivityTitle": ["Walk", "Gym", "Art", "Yoga"],
+            "FixedTimeSlots": ["0-0,1-2", "0-1", "1-1", "1-0,1-2"],
+        })
+
+        # Gym only has one slot left until it is placed, Yoga is excluded on day 1
+        RecommendedRoutineActivityScheduler._RecommendedRoutineActivityScheduler__fillByFixedTimeSlots(
+            schedule, FreeSlotIndex(schedule), activities, PatientProfile(excluded_days={4: 0b10})
+        )
+
+        assert schedule == [["Gym", "Walk", "Lunch"], ["Art", "", ""]]
 
 
 class TestRoutineScheduling:
-    pass
+    def test_partition_by_patient(self):
+        df = pd.DataFrame({"PatientID": [2, 1, 2, 3, 1], "ActivityTitle": ["a", "b", "c", "d", "e"]})
+
+        partitions = _partition_by_patient(df)
+
+        assert {pid: rows["ActivityTitle"].tolist() for pid, rows in partitions.items()} == {1: ["b", "e"], 2: ["a", "c"], 3: ["d"]}
+        assert _partition_by_patient(df.iloc[0:0]) == {}
+
+    def fill(self, workers):
+        recommendations = pd.DataFrame({
+            "PatientID": [1, 1, 2, 3, 3, 2],
+            "ActivityID": [1, 2, 1, 3, 1, 2],
+            "ActivityTitle": ["Walk", "Gym", "Walk", "Art", "Walk", "Gym"],
+            "FixedTimeSlots": ["0-1,1-1", "", "0-1,1-1", "0-0", "0-1,1-1", ""],
+            "ActivityEndDate": [datetime.datetime(2100, 1, 1)] * 6,
+        })
+        routines = pd.DataFrame({
+            "PatientID": [2, 3],
+            "ActivityID": [9, 9],
+            "ActivityTitle": ["Nap", "Nap"],
+            "FixedTimeSlots": ["0-1", "1-0"],
+        })
+        patients = {pid: PatientProfile(excluded_days={2: 0b1} if pid == 3 else {}) for pid in [1, 2, 3]}
+        schedules = {pid: [["", "", ""], ["", "", ""]] for pid in patients}
+        config = {"INDIVIDUAL_SCHEDULING_WORKERS": workers, "INDIVIDUAL_SCHEDULING_CHUNK_SIZE": 1}
+
+        with (
+            patch.object(RecommendedRoutineActivityScheduler, "config", config, create=True),
+            patch.object(RecommendedRoutineActivityScheduler, "_get_patient_data", fake_fn(patients)),
+            patch("pear_schedule.scheduler.individualScheduling.DB"),
+            patch("pear_schedule.scheduler.individualScheduling.RecommendedActivitiesView.get_data", fake_fn(recommendations)),
+            patch("pear_schedule.scheduler.individualScheduling.ValidRoutineActivitiesView.get_data", fake_fn(routines)),
+        ):
+            RecommendedRoutineActivityScheduler.fillSchedule(schedules)
+
+        return schedules
+
+    def test_fill_recommended_and_routines(self):
+        schedules = self.fill(workers=1)
+
+        # fixed activities fill the earliest free slots, then routines, then flexible activities
+        assert schedules[2] == [["Walk", "Nap", "Gym"], ["", "", ""]]
+        assert schedules == self.fill(workers=2)
 
 
 class TestFlexibleRecommendedScheduling:
@@ -88,4 +191,77 @@ class TestFlexibleRecommendedScheduling:
 
 
 class TestPreferredScheduling:
-    pass
+    def fill(self, seed, workers=1, week_start=datetime.date(2024, 1, 1)):
+        activities = pd.DataFrame({
+            "ActivityID": [1, 2, 3, 4, 5],
+            "ActivityTitle": ["Walk", "Gym", "Art", "Yoga", "Chess"],
+            "FixedTimeSlots": [None, "0-1", None, None, None],
+            "MinDuration": [1, 1, 1, 2, 1],
+            "MaxDuration": [1, 1, 1, 2, 1],
+        })
+        patients = {
+            pid: PatientProfile(exclusions=frozenset({5, pid}), preferences=frozenset({2, 3}))
+            for pid in range(1, 7)
+        }
+        schedules = {pid: [["Lunch", "", "", ""], ["", "", "Lunch", ""]] for pid in patients}
+        config = {"PREFERENCE_SHUFFLE_SEED": seed, "INDIVIDUAL_SCHEDULING_WORKERS": workers, "INDIVIDUAL_SCHEDULING_CHUNK_SIZE": 2}
+
+        with (
+            patch.object(PreferredActivityScheduler, "config", config, create=True),
+            patch("pear_schedule.scheduler.individualScheduling.ActivitiesView.get_data", fake_fn(activities)),
+        ):
+            PreferredActivityScheduler.fillPreferences(schedules, patients=patients, week_start=week_start)
+
+        return schedules
+
+    def test_fill_preferences(self):
+        schedule = self.fill(seed=0)[1]
+
+        # Gym is preferred and fixed at day 0 slot 1, Chess is excluded
+        assert schedule[0][1] == "Gym"
+        assert all(activity and activity not in ["Chess", "Walk"] for day in schedule for activity in day)
+        assert schedule == self.fill(seed=0)[1]
+
+    def test_parallel_matches_serial(self):
+        assert self.fill(seed=3, workers=2) == self.fill(seed=3)
+
+    def test_order_changes_between_weeks(self):
+        # any day of a week gives that week's schedules, later weeks break ties differently
+        assert self.fill(seed=0, week_start=datetime.date(2024, 1, 3)) == self.fill(seed=0)
+        weeks = [self.fill(seed=0, week_start=datetime.date(2024, 1, 1) + datetime.timedelta(weeks=w)) for w in range(4)]
+        assert any(week != weeks[0] for week in weeks[1:])
+
+    def test_fixed_preferred_activity_placed_at_its_slots(self):
+        activities = pd.DataFrame({
+            "ActivityID": [1, 2],
+            "ActivityTitle": ["Gym", "Art"],
+            "FixedTimeSlots": ["0-1,1-0", None],
+            "MinDuration": [1, 1],
+            "MaxDuration": [1, 1],
+        })
+        patients = {1: PatientProfile(preferences=frozenset({1}))}
+        schedules = {1: [["Lunch", "", "", ""], ["", "", "Lunch", ""]]}
+
+        with (
+            patch.object(PreferredActivityScheduler, "config", {"PREFERENCE_SHUFFLE_SEED": 0}, create=True),
+            patch("pear_schedule.scheduler.individualScheduling.ActivitiesView.get_data", fake_fn(activities)),
+        ):
+            PreferredActivityScheduler.fillPreferences(schedules, patients=patients)
+
+        # the preferred fixed time activity takes its fixed slots and is never placed anywhere else
+        assert schedules[1][0][1] == "Gym"
+        assert schedules[1][1][0] == "Gym"
+        assert [(day, slot) for day, activities in enumerate(schedules[1]) for slot, a in enumerate(activities) if a == "Gym"] == [(0, 1), (1, 0)]
+
+    def test_catalogue_bitsets(self):
+        catalogue = ActivityCatalogue.from_df(pd.DataFrame({
+            "ActivityID": [7, 3, 7, 9],
+            "ActivityTitle": ["Walk", "Gym", "Walk", "Art"],
+            "FixedTimeSlots": [None, "0-1", "", None],
+            "MinDuration": [1, 0, 2, None],
+        }))
+
+        assert catalogue.bitset({7, 4}) == 0b0101
+        assert catalogue.positions(catalogue.all & ~catalogue.bitset({3})).tolist() == [0, 2, 3]
+        assert catalogue.min_durations == [1, 1, 2, 1]
+        assert catalogue.fixed_slots == [None, frozenset({(0, 1)}), None, None]
@@ -3,6 +3,7 @@ from unittest.mock import patch
 
 import pandas as pd
 import pytest
+from pear_schedule.scheduler.medicationScheduling import medicationScheduler
 from pear_schedule.api.utils import activitiesExcludedPatientTest, checkWeeklyScheduleCorrectness, generateStatistics, getPatientWellnessPlan, getTablesDF, medicationPatientTest, nonPreferredActivitiesPatientTest, nonRecommendedActivitiesPatientTest, preferredActivitiesPatientTest, prepareJsonResponse, prepareMedicationSchedule, recommendedActivitiesPatientTest, routinesPatientTest
 
 class TestPatientTestUtils:
@@ -218,6 +219,56 @@ class TestPatientTestUtils:
             assert medication_day_list == ['Give Medication@0930: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses', 'Give Medication@1300: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses', 'Give Medication@1315: Guaifenesin(10 ml)']
     
     
+    def test_medication_scheduler_matches_prepare_medication_schedule(self, mock_views):
+        fake_medications = pd.DataFrame({
+            'PatientID' : [1, 1],
+            'PrescriptionName' : ["Guaifenesin", "Diphenhydramine"],
+            "Dosage" : ["10 ml","2 tabs"],
+            "AdministerTime" : ['1045,1730', '0930,1015'],
+            "Instruction" : ["nil","Always leave at least 4 hours between doses"],
+            "StartDateTime" : [pd.to_datetime("2000-01-01 00:00:00.0000000"), pd.to_datetime("2000-01-01 00:00:00.0000000")],
+            "EndDateTime" : [pd.to_datetime("2100-12-31 00:00:00.0000000"), pd.to_datetime("2100-12-31 00:00:00.0000000")]
+        })
+        schedules = {1: [["Breathing+Vital Check", "Sewing"] + [""] * 6 for _ in range(5)]}
+        
+        with patch('pear_schedule.scheduler.medicationScheduling.MedicationView.get_data', return_value=fake_medications), \
+            patch.object(medicationScheduler, "config", {"DAYS": 5}, create=True):
+            medicationScheduler.fillSchedule(schedules)
+        
+        start = pd.Timestamp.now().normalize() - pd.Timedelta(days=pd.Timestamp.now().weekday())
+        medication_schedule, _ = prepareMedicationSchedule(fake_medications, start, start + pd.Timedelta(days=7) - pd.Timedelta(seconds=1), DAYS=5)
+        
+        for day in range(5):
+            assert schedules[1][day][0] == "Breathing+Vital Check | Give Medication@0930: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses"
+            assert schedules[1][day][1] == "Sewing | Give Medication@1015: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses, Give Medication@1045: Guaifenesin(10 ml)"
+            assert schedules[1][day][2:] == [""] * 6
+            assert medication_schedule[day] == ['Give Medication@0930: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses', 'Give Medication@1015: Diphenhydramine(2 tabs)**Always leave at least 4 hours between doses', 'Give Medication@1045: Guaifenesin(10 ml)', 'Give Medication@1730: Guaifenesin(10 ml)']
+
+    @pytest.mark.parametrize("instruction", ["Nil", "nil", "-", "", None])
+    def test_medication_empty_instruction_has_no_suffix(self, mock_views, instruction):
+        fake_medications = pd.DataFrame({
+            'PatientID' : [1],
+            'PrescriptionName' : ["Guaifenesin"],
+            "Dosage" : ["10 ml"],
+            "AdministerTime" : ['1045'],
+            "Instruction" : [instruction],
+            "StartDateTime" : [pd.to_datetime("2000-01-01 00:00:00.0000000")],
+            "EndDateTime" : [pd.to_datetime("2100-12-31 00:00:00.0000000")]
+        })
+        schedules = {1: [["Breathing+Vital Check", "Sewing"] + [""] * 6 for _ in range(5)]}
+
+        with patch('pear_schedule.scheduler.medicationScheduling.MedicationView.get_data', return_value=fake_medications), \
+            patch.object(medicationScheduler, "config", {"DAYS": 5}, create=True):
+            medicationScheduler.fillSchedule(schedules)
+
+        start = pd.Timestamp.now().normalize() - pd.Timedelta(days=pd.Timestamp.now().weekday())
+        medication_schedule, _ = prepareMedicationSchedule(fake_medications, start, start + pd.Timedelta(days=7) - pd.Timedelta(seconds=1), DAYS=5)
+
+        for day in range(5):
+            assert schedules[1][day][1] == "Sewing | Give Medication@1045: Guaifenesin(10 ml)"
+            assert medication_schedule[day] == ['Give Medication@1045: Guaifenesin(10 ml)']
+
+    
     '''
     Checking Weekly Schedule Correctness (Assumes that all other functions implemented are correct)
     '''